@@ -0,0 +1,196 @@
+"""
+Saved audiences: named, immutable sets of user IDs kept on the server.
+
+Simulations reference an audience by ID instead of uploading its members.
+Members are held as a sorted unique int64 array, or as a bitset over the
+ID range when that is smaller (dense ranges of IDs), and are persisted to
+one .npz file per audience so they survive restarts and reloads.
+Audiences created with a TTL (such as optimizer selections) expire and
+are the first to be evicted when the store is full.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cache import fingerprint
+
+AUDIENCES_DIR = Path(os.environ.get("TWIN_AUDIENCES_DIR", Path(__file__).parent.parent / "audiences"))
+
+# Saved audiences allowed at once; when full, the audience with a TTL closest to
+# expiry is evicted, and creating more raises if none has one
+MAX_AUDIENCES = int(os.environ.get("TWIN_MAX_AUDIENCES", "1000"))
+
+
+class Audience:
+    """Sorted unique user IDs, stored in whichever encoding is smaller."""
+
+    def __init__(self, audience_id: str, name: str, user_ids: np.ndarray, source: dict,
+                 created_at: Optional[float] = None, expires_at: Optional[float] = None):
+        self.audience_id = audience_id
+        self.name = name
+        self.source = source
+        self.created_at = created_at or time.time()
+        self.expires_at = expires_at
+        self.size = len(user_ids)
+        self.digest = fingerprint(user_ids.tobytes())
+        self._encode(user_ids)
+
+    def _encode(self, user_ids: np.ndarray):
+        self.base = int(user_ids[0]) if self.size else 0
+        span = int(user_ids[-1]) - self.base + 1 if self.size else 0
+        if self.size and span // 8 < self.size * user_ids.itemsize:
+            bits = np.zeros(span, dtype=bool)
+            bits[user_ids - self.base] = True
+            self.encoding, self.data, self.span = 'bitset', np.packbits(bits), span
+        else:
+            self.encoding, self.data, self.span = 'sorted', user_ids, span
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        """Members as a sorted int64 array."""
+        if self.encoding == 'bitset':
+            return np.flatnonzero(np.unpackbits(self.data, count=self.span)) + self.base
+        return self.data
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes)
+
+    def info(self) -> dict:
+        return {
+            'audience_id': self.audience_id,
+            'name': self.name,
+            'size': self.size,
+            'source': self.source,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+            'encoding': self.encoding,
+            'nbytes': self.nbytes
+        }
+
+
+def combine(operation: str, members: List[np.ndarray]) -> np.ndarray:
+    """Fold sorted unique ID arrays with union, intersect or difference (first minus the rest)."""
+    result = members[0]
+    for other in members[1:]:
+        if operation == 'union':
+            result = np.union1d(result, other)
+        elif operation == 'intersect':
+            result = np.intersect1d(result, other, assume_unique=True)
+        elif operation == 'difference':
+            result = np.setdiff1d(result, other, assume_unique=True)
+        else:
+            raise ValueError(f"unknown set operation {operation!r}")
+    return result
+
+
+class AudienceStore:
+    """Saved audiences by ID, persisted to a directory."""
+
+    def __init__(self, directory: Path = AUDIENCES_DIR, max_audiences: int = MAX_AUDIENCES):
+        self.directory = Path(directory)
+        self.max_audiences = max_audiences
+        self._audiences: Dict[str, Audience] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        """Read saved audiences from disk on first use; callers hold the lock."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.directory.exists():
+            return
+        for path in sorted(self.directory.glob("*.npz")):
+            if path.name.endswith(".tmp.npz"):
+                continue
+            with np.load(path) as saved:
+                meta = json.loads(str(saved['meta']))
+                audience = Audience(meta['audience_id'], meta['name'], saved['user_ids'],
+                                    meta['source'], meta['created_at'], meta.get('expires_at'))
+            self._audiences[audience.audience_id] = audience
+
+    def _expire(self):
+        """Drop audiences past their TTL; callers hold the lock."""
+        now = time.time()
+        for audience in list(self._audiences.values()):
+            if audience.expires_at is not None and audience.expires_at <= now:
+                self._remove(audience.audience_id)
+
+    def _evict(self) -> bool:
+        """Drop the TTL'd audience closest to expiry; callers hold the lock."""
+        expiring = [a for a in self._audiences.values() if a.expires_at is not None]
+        if not expiring:
+            return False
+        self._remove(min(expiring, key=lambda a: a.expires_at).audience_id)
+        return True
+
+    def create(self, name: str, user_ids, source: dict, ttl: Optional[float] = None) -> Audience:
+        """
+        Save a new audience from any iterable of user IDs (duplicates are dropped).
+
+        With ttl (seconds) the audience expires and may be evicted to make room.
+        """
+        user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        created_at = time.time()
+        audience = Audience(uuid.uuid4().hex[:12], name, user_ids, source, created_at,
+                            created_at + ttl if ttl else None)
+        with self._lock:
+            self._load()
+            self._expire()
+            if len(self._audiences) >= self.max_audiences and not self._evict():
+                raise OverflowError(f"at most {self.max_audiences} saved audiences")
+            self._save(audience, user_ids)
+            self._audiences[audience.audience_id] = audience
+        return audience
+
+    def combine(self, name: str, operation: str, audience_ids: List[str]) -> Audience:
+        """Save the result of a set operation over existing audiences; KeyError if one is missing."""
+        members = [self.require(audience_id).user_ids for audience_id in audience_ids]
+        return self.create(name, combine(operation, members),
+                           {'operation': operation, 'audience_ids': list(audience_ids)})
+
+    def get(self, audience_id: str) -> Optional[Audience]:
+        with self._lock:
+            self._load()
+            self._expire()
+            return self._audiences.get(audience_id)
+
+    def require(self, audience_id: str) -> Audience:
+        audience = self.get(audience_id)
+        if audience is None:
+            raise KeyError(audience_id)
+        return audience
+
+    def list(self) -> List[Audience]:
+        with self._lock:
+            self._load()
+            self._expire()
+            return sorted(self._audiences.values(), key=lambda a: a.created_at)
+
+    def delete(self, audience_id: str) -> bool:
+        with self._lock:
+            self._load()
+            return self._remove(audience_id)
+
+    def _remove(self, audience_id: str) -> bool:
+        if self._audiences.pop(audience_id, None) is None:
+            return False
+        (self.directory / f"{audience_id}.npz").unlink(missing_ok=True)
+        return True
+
+    def _save(self, audience: Audience, user_ids: np.ndarray):
+        info = audience.info()
+        meta = {k: info[k] for k in ('audience_id', 'name', 'source', 'created_at', 'expires_at')}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{audience.audience_id}.tmp.npz"
+        np.savez_compressed(tmp_path, user_ids=user_ids, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, self.directory / f"{audience.audience_id}.npz")
+
+
+audience_store = AudienceStore()
@@ -0,0 +1,315 @@
+"""
+Benchmarks for the predictor and API hot paths on synthetic twins.
+
+Each size gets a generated dataset (see dummy.py) and models fitted on a
+sample of it, installed as the live predictor. Predictor stages are timed
+directly; endpoints go through an in-process TestClient, so the numbers
+include routing, validation and serialization but no network.
+
+Usage:
+    python bench.py                          # 10K and 100K twins, table on stdout
+    python bench.py --sizes 10000 1000000 --out run.json
+    python bench.py --compare base.json --out run.json
+    python bench.py --load --concurrency 8 --duration 30
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("TWIN_EAGER_LOAD", "0")
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dummy import make_campaign_pool, simulate_chunk
+from train_model import FEATURE_COLS, TARGETS, make_preprocessor, make_classifier
+from predictor import DigitalTwinPredictor
+from registry import registry
+
+DEFAULT_SIZES = [10000, 100000]
+
+# Rows the benchmark models are fitted on, whatever the dataset size
+TRAIN_ROWS = 20000
+
+# Audience for simulation cases; the README's "<800ms" is for 10K twins
+AUDIENCE_SIZE = 10000
+
+# p99 latency budget for /simulate, from the README
+SIMULATE_BUDGET_MS = 800.0
+
+# Relative slowdown in p50 reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def synthetic_predictor(n_twins: int, seed: int = 42) -> DigitalTwinPredictor:
+    """In-memory predictor over n_twins generated users with quickly fitted models."""
+    from sklearn.pipeline import Pipeline
+
+    rng = np.random.default_rng(seed)
+    raw = simulate_chunk(rng, 1001, n_twins, 1, make_campaign_pool(rng))
+    sample = raw.sample(min(TRAIN_ROWS, len(raw)), random_state=seed)
+    preprocessor = make_preprocessor().fit(sample[FEATURE_COLS])
+    X = preprocessor.transform(sample[FEATURE_COLS])
+    models = {}
+    for target in TARGETS:
+        classifier = make_classifier('hist').fit(X, sample[target])
+        models[f'{target}_model'] = Pipeline(steps=[('preprocessor', preprocessor),
+                                                    ('classifier', classifier)])
+    return DigitalTwinPredictor(data=raw, models=models)
+
+
+def process_peak_rss_mb() -> float:
+    """
+    High-water mark of the whole bench process's resident memory.
+
+    Covers every case run so far, not only the one it is reported with.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(fn: Callable[[], object], repeats: int, warmup: int = 1) -> Dict[str, float]:
+    """Latency percentiles and throughput of repeated calls to fn."""
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(repeats)
+    started = time.perf_counter()
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - t0
+    return stats(latencies, time.perf_counter() - started)
+
+
+def stats(latencies: np.ndarray, elapsed: float) -> Dict[str, float]:
+    return {
+        'n': int(len(latencies)),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'throughput_per_s': round(len(latencies) / max(elapsed, 1e-9), 1),
+        'process_peak_rss_mb': round(process_peak_rss_mb(), 1)
+    }
+
+
+def predictor_cases(predictor: DigitalTwinPredictor, audience: List[int]) -> Dict[str, Callable]:
+    """Predictor stages, each as a zero-argument call."""
+    twins = predictor.twins
+    profile_ids = twins.profile_ids[twins.positions(audience)]
+    campaign = ('Promo', 'Flash Sale: 50% Off Everything!', 10)
+
+    def score_cold():
+        predictor.campaign_cache.clear()
+        predictor.variant_probs(profile_ids, [(campaign[0], len(campaign[1]), campaign[2])])
+
+    def filter_uncached():
+        twins.filter_cache.clear()
+        twins.filter('Bargain Hunter', 'High', 30, 50)
+
+    return {
+        'get_unique_customers': predictor.get_unique_customers,
+        'positions': lambda: twins.positions(audience),
+        'filter_uncached': filter_uncached,
+        'score_cold': score_cold,
+        'predict_batch': lambda: predictor.predict_batch(audience, *campaign),
+        'predict': lambda: predictor.predict(audience, *campaign),
+        'summary': lambda: predictor.predict_batch(audience, *campaign).summary()
+    }
+
+
+def endpoint_cases(client, audience: List[int], cold: bool = True) -> Dict[str, Callable]:
+    """
+    API requests, each as a zero-argument call that fails on a non-2xx status.
+
+    Simulations run twice: uncached, with the result and campaign caches
+    cleared before each call, and "(cached)", repeating one warm request.
+    cold=False leaves out the uncached cases, whose cache clearing would
+    disturb other clients running at the same time.
+    """
+    from main import result_cache
+
+    campaign = {'type': 'Promo', 'subject_line': 'Flash Sale: 50% Off Everything!', 'send_hour': 10}
+
+    def call(method: str, url: str, cold: bool = False, **kwargs):
+        def run():
+            if cold:
+                result_cache.clear()
+                registry.current.campaign_cache.clear()
+            response = client.request(method, url, **kwargs)
+            response.raise_for_status()
+        return run
+
+    cases = {
+        'GET /customers': call('GET', '/customers', params={'page_size': 50}),
+        'GET /customers?filters': call('GET', '/customers', params={
+            'segment': 'Bargain Hunter', 'income': 'High', 'min_age': 30, 'max_age': 50}),
+        'GET /customers/{id}': call('GET', f'/customers/{audience[0]}')
+    }
+    for name, body in (('POST /simulate summary', {'detail': 'summary'}), ('POST /simulate full', {})):
+        body = {'customer_ids': audience, 'campaign': campaign, **body}
+        if cold:
+            cases[name] = call('POST', '/simulate', cold=True, json=body)
+        cases[f'{name} (cached)'] = call('POST', '/simulate', json=body)
+    return cases
+
+
+def run_benchmarks(sizes: List[int], repeats: int, seed: int = 42) -> List[dict]:
+    """Time every predictor stage and endpoint at each dataset size."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    results = []
+    client = TestClient(app)
+    for n_twins in sizes:
+        started = time.perf_counter()
+        predictor = synthetic_predictor(n_twins, seed)
+        registry.install(predictor)
+        print(f"✓ {n_twins} twins ready in {time.perf_counter() - started:.1f}s")
+        budget = predictor.twins.memory_budget()
+        results.append({'twins': n_twins, 'kind': 'memory', 'name': 'twin_store', **budget})
+        print(f"  twin store: {budget['bytes_per_twin']:.0f} bytes/twin {budget['parts']}")
+
+        audience = predictor.twins.user_ids[:min(AUDIENCE_SIZE, n_twins)].tolist()
+        for kind, cases in (('predictor', predictor_cases(predictor, audience)),
+                            ('endpoint', endpoint_cases(client, audience))):
+            for name, fn in cases.items():
+                result = {'twins': n_twins, 'kind': kind, 'name': name}
+                result.update(measure(fn, repeats))
+                results.append(result)
+                print(f"  {name:<34}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f} ms"
+                      f"{result['throughput_per_s']:>10.1f}/s"
+                      f"{result['process_peak_rss_mb']:>9.0f} MB process peak")
+    return results
+
+
+def run_load(n_twins: int, concurrency: int, duration: float, seed: int = 42) -> List[dict]:
+    """
+    Drive a mixed request stream from concurrent clients for duration seconds.
+
+    Requests rejected by the simulation queue (429) are counted, not timed.
+    Only warm cases run: the uncached ones clear the shared caches, which
+    would turn other threads' cached requests cold mid-measurement.
+    """
+    from fastapi.testclient import TestClient
+    from main import app
+
+    predictor = synthetic_predictor(n_twins, seed)
+    registry.install(predictor)
+    audience = predictor.twins.user_ids[:min(AUDIENCE_SIZE, n_twins)].tolist()
+
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int):
+        client = TestClient(app, raise_server_exceptions=False)
+        cases = list(endpoint_cases(client, audience, cold=False).items())
+        i = index
+        while time.perf_counter() < deadline:
+            name, fn = cases[i % len(cases)]
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                fn()
+                status = 200
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', 0)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.setdefault(name, []).append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name, values in sorted(latencies.items()):
+        result = {'twins': n_twins, 'kind': 'load', 'name': name, 'concurrency': concurrency}
+        result.update(stats(np.asarray(values), elapsed))
+        results.append(result)
+        print(f"  {name:<34}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f} ms"
+              f"{result['throughput_per_s']:>10.1f}/s")
+    print(f"  status codes: {dict(sorted(statuses.items()))}")
+    results.append({'twins': n_twins, 'kind': 'load', 'name': 'status_codes',
+                    'counts': {str(k): v for k, v in statuses.items()}})
+    return results
+
+
+def check_budget(results: List[dict], budget_ms: float = SIMULATE_BUDGET_MS) -> List[str]:
+    """Names of uncached /simulate results over the latency budget at the README's 10K twins."""
+    return [f"{r['name']} @ {r['twins']}: p99 {r['p99_ms']:.0f}ms"
+            for r in results
+            if r['name'].startswith('POST /simulate') and not r['name'].endswith('(cached)')
+            and r['twins'] <= AUDIENCE_SIZE and r.get('p99_ms', 0) > budget_ms]
+
+
+def compare(results: List[dict], baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Cases whose p50 got slower than the baseline run by more than threshold."""
+    base = {(r['twins'], r['kind'], r['name']): r for r in baseline['results'] if 'p50_ms' in r}
+    regressions = []
+    for r in results:
+        old = base.get((r['twins'], r['kind'], r['name']))
+        if old is None or 'p50_ms' not in r or old['p50_ms'] <= 0:
+            continue
+        change = r['p50_ms'] / old['p50_ms'] - 1
+        if change > threshold:
+            regressions.append(f"{r['name']} @ {r['twins']}: p50 {old['p50_ms']:.2f} -> "
+                               f"{r['p50_ms']:.2f}ms (+{change:.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark predictor stages and API endpoints")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="twin counts")
+    parser.add_argument("--repeats", type=int, default=20, help="timed calls per case")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--load", action="store_true", help="run the concurrent load generator")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="load test seconds")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to check for regressions")
+    args = parser.parse_args(argv)
+
+    if args.load:
+        results = []
+        for n_twins in args.sizes:
+            results += run_load(n_twins, args.concurrency, args.duration, args.seed)
+    else:
+        results = run_benchmarks(args.sizes, args.repeats, args.seed)
+
+    report = {
+        'created_at': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'args': {k: str(v) for k, v in vars(args).items()},
+        'results': results
+    }
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"✓ Results written to {args.out}")
+
+    problems = check_budget(results)
+    if args.compare:
+        problems += compare(results, json.loads(args.compare.read_text()))
+    for problem in problems:
+        print(f"! {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
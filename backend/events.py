@@ -0,0 +1,221 @@
+"""
+Append-only engagement event log that keeps twin counters current.
+
+Events are appended to an NDJSON log and folded straight into the live twin
+store's counters, so nothing is re-aggregated. Once the log passes a size
+threshold it is rotated and folded into a compact per-user counts file;
+replaying that file plus the log rebuilds the counters for a fresh twin
+store after a restart or reload.
+
+Usage:
+    python events.py EVENTS.ndjson               # append a file to the log offline
+    python events.py EVENTS.ndjson --url URL     # post it to a running server in batches
+    python events.py --compact                   # fold the log into the counts file
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Event kinds, in the column order of twin_store.COUNTER_COLUMNS
+EVENT_KINDS = ['send', 'open', 'click', 'convert']
+
+EVENTS_DIR = Path(os.environ.get("TWIN_EVENTS_DIR", Path(__file__).parent.parent / "events"))
+
+# Log size that triggers rotation and compaction in the background
+COMPACT_BYTES = int(os.environ.get("TWIN_EVENTS_COMPACT_BYTES", str(64 * 1024 * 1024)))
+
+# Events per request when posting a file to a running server
+LOAD_BATCH_SIZE = 20000
+
+_KIND_CODES = {kind: i for i, kind in enumerate(EVENT_KINDS)}
+
+
+def fold(user_ids: np.ndarray, kinds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapse events into unique user IDs and (ids, EVENT_KINDS) count deltas."""
+    unique_ids, inverse = np.unique(user_ids, return_inverse=True)
+    deltas = np.zeros((len(unique_ids), len(EVENT_KINDS)), dtype=np.int64)
+    np.add.at(deltas, (inverse, kinds), 1)
+    return unique_ids, deltas
+
+
+def encode_kinds(kinds: List[str]) -> np.ndarray:
+    """Event kind names to integer codes; raises KeyError on unknown kinds."""
+    return np.fromiter((_KIND_CODES[k] for k in kinds), dtype=np.int64, count=len(kinds))
+
+
+class EventStore:
+    """
+    Event log plus compacted counts, shared by every predictor version.
+
+    lock serializes appends with predictor swaps (see PredictorRegistry), so an
+    event is applied either to the old version before the swap or replayed
+    into the new one, never lost in between.
+    """
+
+    def __init__(self, directory: Path = EVENTS_DIR, compact_bytes: int = COMPACT_BYTES):
+        self.directory = Path(directory)
+        self.log_path = self.directory / "events.ndjson"
+        self.rotated_path = self.directory / "events.compacting.ndjson"
+        self.counts_path = self.directory / "counts.npz"
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self.appended = 0
+
+    def append(self, user_ids: np.ndarray, kinds: np.ndarray,
+               campaign_ids: Optional[List[Optional[str]]] = None,
+               timestamps: Optional[List[Optional[float]]] = None):
+        """Append encoded events to the log in a single write."""
+        now = time.time()
+        campaign_ids = campaign_ids or [None] * len(user_ids)
+        timestamps = timestamps or [None] * len(user_ids)
+        lines = ''.join(
+            json.dumps({'user_id': uid, 'event': EVENT_KINDS[kind], 'campaign_id': cid,
+                        'timestamp': ts if ts is not None else now}, separators=(',', ':')) + '\n'
+            for uid, kind, cid, ts in zip(user_ids.tolist(), kinds.tolist(), campaign_ids, timestamps)
+        )
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, 'a') as log:
+                log.write(lines)
+            self.appended += len(user_ids)
+
+    def ingest(self, twins_source, user_ids: np.ndarray, kinds: np.ndarray,
+               campaign_ids=None, timestamps=None) -> int:
+        """
+        Log events and apply them to the live twin store.
+
+        twins_source is called under the lock to get the current TwinStore.
+        Returns how many events matched a known twin.
+        """
+        unique_ids, deltas = fold(user_ids, kinds)
+        # Load the first version before taking the lock; loading replays events under it
+        twins_source()
+        with self.lock:
+            self.append(user_ids, kinds, campaign_ids, timestamps)
+            twins = twins_source()
+            accepted = int((twins.index.get_indexer(user_ids) >= 0).sum())
+            twins.apply_counts(unique_ids, deltas)
+        if self.log_path.exists() and self.log_path.stat().st_size >= self.compact_bytes:
+            self.compact_in_background()
+        return accepted
+
+    def replay_into(self, twins):
+        """Apply the compacted counts and every logged event to a fresh twin store."""
+        with self.lock:
+            if self.counts_path.exists():
+                with np.load(self.counts_path) as counts:
+                    twins.apply_counts(counts['user_ids'], counts['deltas'])
+            for path in (self.rotated_path, self.log_path):
+                user_ids, kinds = _read_log(path)
+                if len(user_ids):
+                    twins.apply_counts(*fold(user_ids, kinds))
+
+    def compact_in_background(self):
+        """Start a compaction unless one is already running."""
+        if self._compact_lock.locked():
+            return
+        threading.Thread(target=self.compact, name="event-compaction", daemon=True).start()
+
+    def compact(self):
+        """Fold the log into the counts file and start a fresh log."""
+        if not self._compact_lock.acquire(blocking=False):
+            return
+        try:
+            # Rotating is a rename, so appends only wait for that, not the fold
+            with self.lock:
+                if self.log_path.exists() and not self.rotated_path.exists():
+                    os.replace(self.log_path, self.rotated_path)
+            user_ids, kinds = _read_log(self.rotated_path)
+
+            with self.lock:
+                if self.counts_path.exists():
+                    with np.load(self.counts_path) as counts:
+                        user_ids = np.concatenate([counts['user_ids'], user_ids])
+                        existing = counts['deltas']
+                else:
+                    existing = np.zeros((0, len(EVENT_KINDS)), dtype=np.int64)
+                n_existing = len(existing)
+                unique_ids, inverse = np.unique(user_ids, return_inverse=True)
+                deltas = np.zeros((len(unique_ids), len(EVENT_KINDS)), dtype=np.int64)
+                np.add.at(deltas, inverse[:n_existing], existing)
+                np.add.at(deltas, (inverse[n_existing:], kinds), 1)
+
+                tmp_path = self.counts_path.with_suffix('.tmp.npz')
+                np.savez(tmp_path, user_ids=unique_ids, deltas=deltas)
+                os.replace(tmp_path, self.counts_path)
+                if self.rotated_path.exists():
+                    os.remove(self.rotated_path)
+            print(f"✓ Compacted {len(kinds)} events into counts for {len(unique_ids)} twins")
+        finally:
+            self._compact_lock.release()
+
+
+def _read_log(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """User IDs and kind codes of every event in an NDJSON log file."""
+    if not path.exists():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    user_ids, kinds = [], []
+    with open(path) as log:
+        for line in log:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            user_ids.append(event['user_id'])
+            kinds.append(_KIND_CODES[event['event']])
+    return np.asarray(user_ids, dtype=np.int64), np.asarray(kinds, dtype=np.int64)
+
+
+def _iter_batches(path: Path, size: int):
+    batch = []
+    with open(path) as source:
+        for line in source:
+            if line.strip():
+                batch.append(json.loads(line))
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def load_file(path: Path, url: Optional[str] = None, batch_size: int = LOAD_BATCH_SIZE):
+    """Append an NDJSON event file to the log, or post it to a running server."""
+    import urllib.request
+
+    store = EventStore()
+    total = 0
+    started = time.perf_counter()
+    for batch in _iter_batches(path, batch_size):
+        if url:
+            request = urllib.request.Request(
+                url.rstrip('/') + '/events',
+                data=json.dumps({'events': batch}).encode(),
+                headers={'Content-Type': 'application/json'}
+            )
+            urllib.request.urlopen(request).read()
+        else:
+            store.append(np.asarray([e['user_id'] for e in batch], dtype=np.int64),
+                         encode_kinds([e['event'] for e in batch]),
+                         [e.get('campaign_id') for e in batch],
+                         [e.get('timestamp') for e in batch])
+        total += len(batch)
+    elapsed = time.perf_counter() - started
+    print(f"✓ Loaded {total} events in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f}/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load or compact engagement events")
+    parser.add_argument("path", nargs="?", type=Path, help="NDJSON file of events")
+    parser.add_argument("--url", help="post to a running API instead of writing the log")
+    parser.add_argument("--compact", action="store_true", help="fold the log into counts.npz")
+    args = parser.parse_args()
+    if args.path:
+        load_file(args.path, args.url)
+    if args.compact:
+        EventStore().compact()
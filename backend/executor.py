@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from fastapi import HTTPException
+
+# Concurrent CPU-bound jobs (pandas/NumPy/sklearn release the GIL for most of the work)
+SIM_WORKERS = int(os.environ.get("TWIN_SIM_WORKERS", "4"))
+
+# Jobs allowed to wait for a worker before new ones are rejected with 429
+SIM_MAX_QUEUE = int(os.environ.get("TWIN_SIM_MAX_QUEUE", "16"))
+
+# Seconds a request waits for its job before giving up with 504
+SIM_TIMEOUT_S = float(os.environ.get("TWIN_SIM_TIMEOUT_S", "30"))
+
+# Event ingestion gets its own small pool so writes never queue behind simulations
+EVENT_WORKERS = int(os.environ.get("TWIN_EVENT_WORKERS", "1"))
+EVENT_MAX_QUEUE = int(os.environ.get("TWIN_EVENT_MAX_QUEUE", "64"))
+EVENT_TIMEOUT_S = float(os.environ.get("TWIN_EVENT_TIMEOUT_S", "30"))
+
+
+class BoundedExecutor:
+    """
+    Thread pool for CPU-heavy handlers with a cap on queued work.
+
+    Keeps the event loop free for cheap endpoints. A job counts against the
+    queue until its thread actually finishes, even if the request timed out.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float, name: str = "simulation"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix=f"twin-{name}")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Jobs running or waiting for a worker."""
+        return self._pending
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool; 429 when saturated, 504 on timeout."""
+        self._acquire()
+        try:
+            # Run in a copy of the caller's context so stage timings reach its request
+            context = contextvars.copy_context()
+            future = self._pool.submit(context.run, partial(fn, *args, **kwargs))
+        except RuntimeError:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"{self.name.capitalize()} timed out")
+
+    def stream(self, items: Iterator, timeout: Optional[float] = None) -> AsyncIterator:
+        """
+        Pull items from a blocking iterator one at a time on the pool.
+
+        Raises 429 here, before any response is sent, when the pool is
+        saturated. Once iteration starts the stream holds one queue slot until
+        the iterator is exhausted or abandoned. After timeout seconds no
+        further item is requested and the stream raises TimeoutError.
+        """
+        self._acquire()
+        # The slot is taken again when iteration starts, so a stream that is never
+        # iterated (client gone before the first chunk) cannot leak it
+        self._release(None)
+        return self._stream(items, time.monotonic() + (timeout or self.timeout))
+
+    async def _stream(self, items: Iterator, deadline: float) -> AsyncIterator:
+        with self._lock:
+            self._pending += 1
+        context = contextvars.copy_context()
+        done = object()
+        future = None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("stream deadline passed")
+                future = self._pool.submit(context.run, next, items, done)
+                item = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+                if item is done:
+                    return
+                yield item
+        except asyncio.TimeoutError:
+            raise TimeoutError("stream deadline passed")
+        finally:
+            # An item still being computed keeps the slot until its thread finishes
+            if future is not None and not future.done():
+                future.add_done_callback(self._release)
+            else:
+                self._release(None)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(status_code=429, detail=f"{self.name.capitalize()} queue is full, retry shortly",
+                                    headers={"Retry-After": "1"})
+            self._pending += 1
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        """Stop accepting work and wait for running jobs."""
+        self._pool.shutdown(wait=True)
+
+
+simulation_pool = BoundedExecutor(SIM_WORKERS, SIM_MAX_QUEUE, SIM_TIMEOUT_S)
+event_pool = BoundedExecutor(EVENT_WORKERS, EVENT_MAX_QUEUE, EVENT_TIMEOUT_S, name="event ingestion")
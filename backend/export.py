@@ -0,0 +1,55 @@
+import io
+import json
+import numpy as np
+from typing import Iterator
+
+from twin_store import TwinStore, TWIN_COLUMNS
+
+# Twins serialized per chunk; bounds memory regardless of audience size
+EXPORT_CHUNK_SIZE = 10000
+
+
+def iter_ndjson(twins: TwinStore, positions: np.ndarray,
+                chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream twins at the given positions as newline-delimited JSON."""
+    for start in range(0, len(positions), chunk_size):
+        rows = twins.records(positions[start:start + chunk_size])
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows).encode()
+
+
+def iter_arrow(twins: TwinStore, positions: np.ndarray,
+               chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream twins at the given positions as an Arrow IPC stream, one batch per chunk."""
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+    for start in range(0, len(positions), chunk_size):
+        cols = twins.columns(positions[start:start + chunk_size])
+        batch = pa.RecordBatch.from_arrays([pa.array(cols[c]) for c in TWIN_COLUMNS],
+                                           names=TWIN_COLUMNS)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    """Return and clear whatever has been written to the sink so far."""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def arrow_available() -> bool:
+    """Whether the optional pyarrow dependency is installed."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
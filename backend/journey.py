@@ -0,0 +1,153 @@
+"""
+Multi-step campaign journeys: a schedule of sends over one population.
+
+Twin state is kept in flat arrays and updated between steps: twins that
+unsubscribe receive no later steps, conversions add to past_purchase_count
+(a model feature, so they shift later probabilities), and sends, opens,
+clicks and conversions accumulate as journey history. Each step scores
+only the distinct (profile, purchase count) states still active, so the
+per-step cost is linear in active twins plus a small model pass.
+"""
+import json
+import time
+import numpy as np
+from typing import Iterator, List, Tuple
+
+from metrics import stage
+from predictor import FEATURE_COLS
+from results import TARGETS, summarize
+from twin_store import COUNTER_COLUMNS, COUNTER_DTYPE
+
+# Profile columns that never change during a journey
+STATIC_COLUMNS = ['age', 'income_bracket', 'interest_segment']
+
+_UNSUB = TARGETS.index('unsub')
+_CONVERT = TARGETS.index('convert')
+
+# Outcome row added to each COUNTER_COLUMNS counter after a step; sends are added separately
+_COUNTER_OUTCOMES = {
+    'historical_opens': TARGETS.index('open'),
+    'historical_clicks': TARGETS.index('click'),
+    'historical_conversions': _CONVERT
+}
+
+
+def simulate_journey(
+    predictor,
+    positions: np.ndarray,
+    campaigns: List[Tuple[str, str, int]],
+    seed: int = 42
+) -> Iterator[dict]:
+    """
+    Run (campaign_type, subject_line, send_hour) steps in order over the twins at positions.
+
+    Yields one funnel row per step as it completes, then a journey summary
+    (marked with 'summary': True). Step i samples from an RNG seeded with
+    (seed, i), so results are reproducible for a seed.
+    """
+    twins = predictor.twins
+    profiles = twins.profiles
+    static_of_profile = profiles.groupby(STATIC_COLUMNS, sort=False, dropna=False,
+                                         observed=True).ngroup().to_numpy()
+    _, first = np.unique(static_of_profile, return_index=True)
+    statics = profiles[STATIC_COLUMNS].take(first).reset_index(drop=True)
+
+    profile_ids = twins.profile_ids[positions]
+    static_ids = static_of_profile[profile_ids]
+    purchases = profiles['past_purchase_count'].to_numpy()[profile_ids].astype(np.int32)
+    del profile_ids
+    history = {col: twins.counters[col][positions].astype(COUNTER_DTYPE) for col in COUNTER_COLUMNS}
+
+    n = len(positions)
+    active = np.ones(n, dtype=bool)
+    converted_any = np.zeros(n, dtype=bool)
+    totals = np.zeros(len(TARGETS), dtype=np.int64)
+    sends = 0
+    # Purchase counts can grow by one per step, so this stride keeps state keys unique
+    stride = int(purchases.max(initial=0)) + len(campaigns) + 1
+    journey_started = time.perf_counter()
+
+    for step, (campaign_type, subject_line, send_hour) in enumerate(campaigns):
+        started = time.perf_counter()
+        idx = np.flatnonzero(active)
+
+        with stage("journey_score"):
+            keys = static_ids[idx].astype(np.int64) * stride + purchases[idx]
+            states, inverse = _dedupe(keys, len(statics) * stride)
+            X = statics.take(states // stride).reset_index(drop=True)
+            X['past_purchase_count'] = states % stride
+            X['campaign_type'] = campaign_type
+            X['subject_length'] = len(subject_line)
+            X['send_hour'] = send_hour
+            probs = predictor.predict_proba(X[FEATURE_COLS])[:, inverse]
+
+        with stage("journey_sample"):
+            outcomes = np.random.default_rng([seed, step]).random(probs.shape) < probs
+            counts = outcomes.sum(axis=1)
+            active[idx[outcomes[_UNSUB]]] = False
+            converters = idx[outcomes[_CONVERT]]
+            purchases[converters] += 1
+            converted_any[converters] = True
+            history['historical_sends'][idx] += 1
+            for col, target in _COUNTER_OUTCOMES.items():
+                history[col][idx[outcomes[target]]] += 1
+
+        totals += counts
+        sends += len(idx)
+        row = summarize(len(idx), counts)
+        row.update({
+            'step': step,
+            'campaign_type': campaign_type,
+            'subject_line': subject_line,
+            'send_hour': send_hour,
+            'remaining_customers': int(active.sum()),
+            'cumulative_unsubscribes': int(totals[_UNSUB]),
+            'cumulative_conversions': int(totals[_CONVERT]),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
+        yield row
+
+    yield {
+        'summary': True,
+        'total_customers': n,
+        'steps': len(campaigns),
+        'total_sends': sends,
+        'total_opens': int(totals[TARGETS.index('open')]),
+        'total_clicks': int(totals[TARGETS.index('click')]),
+        'total_unsubscribes': int(totals[_UNSUB]),
+        'total_conversions': int(totals[_CONVERT]),
+        'retained_customers': int(active.sum()),
+        'converted_customers': int(converted_any.sum()),
+        'historical_totals': {col: int(values.sum(dtype=np.int64)) for col, values in history.items()},
+        'elapsed_ms': round((time.perf_counter() - journey_started) * 1000, 2)
+    }
+
+
+def run_journey(predictor, positions: np.ndarray, campaigns: List[Tuple[str, str, int]],
+                seed: int = 42) -> dict:
+    """Whole journey as {'steps': [...], 'summary': {...}}."""
+    rows = list(simulate_journey(predictor, positions, campaigns, seed))
+    summary = rows.pop()
+    summary.pop('summary')
+    return {'steps': rows, 'summary': summary}
+
+
+def iter_journey_ndjson(predictor, positions: np.ndarray, campaigns: List[Tuple[str, str, int]],
+                        seed: int = 42) -> Iterator[bytes]:
+    """Journey progress as NDJSON: one 'step' line per step, then a 'summary' line."""
+    for row in simulate_journey(predictor, positions, campaigns, seed):
+        kind = 'summary' if row.pop('summary', False) else 'step'
+        yield (json.dumps({'type': kind, **row}, separators=(',', ':')) + '\n').encode()
+
+
+def _dedupe(keys: np.ndarray, key_space: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted distinct keys and each key's index into them."""
+    if key_space > 8 * len(keys) + 65536:
+        return np.unique(keys, return_inverse=True)
+    # Small key space: a lookup table avoids sorting every active twin
+    seen = np.zeros(key_space, dtype=bool)
+    seen[keys] = True
+    distinct = np.flatnonzero(seen)
+    lookup = np.empty(key_space, dtype=np.int64)
+    lookup[distinct] = np.arange(len(distinct))
+    return distinct, lookup[keys]
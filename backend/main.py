@@ -1,12 +1,52 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import os
+import time
+import numpy as np
 from typing import List, Optional
 
 from models import (
     Customer, Campaign, SimulationRequest, SimulationResponse,
-    SimulationSummary, CustomerPrediction, CustomerListResponse, CampaignType
+    CustomerListResponse, CampaignType, DetailLevel,
+    BatchSimulationRequest, BatchSimulationResponse, SweepRequest, SweepResponse,
+    EventBatch, IngestResponse, AudienceCreate, AudienceCombine, AudienceInfo,
+    AudienceListResponse, MonteCarloRequest, MonteCarloResponse, AudienceOptimizeRequest,
+    AudienceOptimizeResponse, AudienceObjective, JourneyRequest, JourneyResponse
 )
-from predictor import get_predictor
+from registry import registry, event_store, get_predictor
+from audiences import audience_store
+from events import encode_kinds
+from results import PredictionBatch, BREAKDOWN_COLUMNS, TARGETS, MAX_REPLICATE_DRAWS, compare_variants
+from export import iter_ndjson, iter_arrow, arrow_available
+from optimizer import sweep_campaign, select_audience, MAX_SWEEP_POINTS
+from journey import run_journey, iter_journey_ndjson
+from executor import simulation_pool, event_pool
+from sharding import SHARD_MIN_TWINS, shutdown_sharded_simulator
+from cache import LRUCache, fingerprint
+from metrics import (
+    SERVER_TIMING, request_seconds, stage_seconds, stage, start_trace, server_timing,
+    gauge, cache_lines
+)
+
+# Response header naming the model/data version that served a request
+VERSION_HEADER = "X-Model-Version"
+
+# Serialized simulation responses kept for repeat requests
+RESULT_CACHE_ENTRIES = int(os.environ.get("TWIN_RESULT_CACHE_ENTRIES", "1024"))
+RESULT_CACHE_MB = int(os.environ.get("TWIN_RESULT_CACHE_MB", "256"))
+
+result_cache = LRUCache(RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_MB * 1024 * 1024)
+
+# Seconds an audience saved by /optimize/audience is kept; 0 keeps it until deleted
+OPTIMIZED_AUDIENCE_TTL_S = float(os.environ.get("TWIN_OPTIMIZED_AUDIENCE_TTL_S", "86400"))
+
+# Largest selection /optimize/audience returns inline with include_user_ids
+MAX_INLINE_USER_IDS = int(os.environ.get("TWIN_MAX_INLINE_USER_IDS", "100000"))
+
+# Seconds a streamed journey may run; no further step starts after this
+JOURNEY_STREAM_TIMEOUT_S = float(os.environ.get("TWIN_JOURNEY_STREAM_TIMEOUT_S", "300"))
 
 app = FastAPI(
     title="Digital Twin Campaign Backtester",
@@ -21,9 +61,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[VERSION_HEADER, "Server-Timing", "ETag"],
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request by route and collect its stage timings."""
+    started = time.perf_counter()
+    timings = start_trace()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    
+    # Route templates keep the label set small (/customers/{user_id}, not every ID)
+    route = request.scope.get("route")
+    request_seconds.observe(elapsed, request.method, route.path if route else "unmatched",
+                            str(response.status_code))
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
 @app.get("/")
 async def root():
     return {"message": "Digital Twin API", "status": "online"}
@@ -31,61 +90,78 @@ async def root():
 
 @app.get("/customers", response_model=CustomerListResponse)
 async def get_customers(
+    response: Response,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=10000),
     segment: Optional[str] = None,
     income: Optional[str] = None,
     min_age: Optional[int] = None,
-    max_age: Optional[int] = None
+    max_age: Optional[int] = None,
+    after_user_id: Optional[int] = None
 ):
-    """Get paginated list of customers with optional filters."""
-    predictor = get_predictor()
-    customers_df = predictor.get_unique_customers()
+    """
+    Get paginated list of customers with optional filters.
     
-    # Apply filters
-    if segment:
-        customers_df = customers_df[customers_df['interest_segment'] == segment]
-    if income:
-        customers_df = customers_df[customers_df['income_bracket'] == income]
-    if min_age:
-        customers_df = customers_df[customers_df['age'] >= min_age]
-    if max_age:
-        customers_df = customers_df[customers_df['age'] <= max_age]
+    Pass after_user_id (the previous page's next_cursor) for keyset pagination;
+    otherwise page selects an offset.
+    """
+    predictor = get_predictor()
+    twins = predictor.twins
+    response.headers[VERSION_HEADER] = predictor.version
     
-    total = len(customers_df)
+    # Resolve filters through the twin store's secondary indexes
+    positions = twins.filter(segment=segment, income=income, min_age=min_age, max_age=max_age)
+    total = len(positions)
     
     # Paginate
-    start = (page - 1) * page_size
+    if after_user_id is not None:
+        start = twins.seek(positions, after_user_id)
+    else:
+        start = (page - 1) * page_size
     end = start + page_size
-    page_data = customers_df.iloc[start:end]
-    
-    customers = [
-        Customer(
-            user_id=int(row['user_id']),
-            name=row['name'],
-            age=int(row['age']),
-            income_bracket=row['income_bracket'],
-            interest_segment=row['interest_segment'],
-            past_purchase_count=int(row['past_purchase_count']),
-            historical_opens=int(row['historical_opens']),
-            historical_clicks=int(row['historical_clicks']),
-            historical_conversions=int(row['historical_conversions'])
-        )
-        for _, row in page_data.iterrows()
-    ]
-    
-    return CustomerListResponse(
-        customers=customers,
-        total=total,
-        page=page,
-        page_size=page_size
-    )
+    page_positions = positions[start:end]
+    
+    # Records are plain dicts; response_model validates them once on the way out
+    customers = twins.records(page_positions)
+    next_cursor = customers[-1]["user_id"] if customers and end < total else None
+    
+    return {
+        "customers": customers,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "next_cursor": next_cursor
+    }
+
+
+@app.get("/customers/export")
+async def export_customers(
+    format: str = Query("ndjson", pattern="^(ndjson|arrow)$"),
+    segment: Optional[str] = None,
+    income: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None
+):
+    """Stream every matching customer as NDJSON or an Arrow IPC stream."""
+    predictor = get_predictor()
+    twins = predictor.twins
+    positions = twins.filter(segment=segment, income=income, min_age=min_age, max_age=max_age)
+    
+    if format == "arrow":
+        if not arrow_available():
+            raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+        return StreamingResponse(iter_arrow(twins, positions),
+                                 media_type="application/vnd.apache.arrow.stream",
+                                 headers={VERSION_HEADER: predictor.version})
+    return StreamingResponse(iter_ndjson(twins, positions), media_type="application/x-ndjson",
+                             headers={VERSION_HEADER: predictor.version})
 
 
 @app.get("/customers/{user_id}", response_model=Customer)
-async def get_customer(user_id: int):
+async def get_customer(user_id: int, response: Response):
     """Get a single customer by ID."""
     predictor = get_predictor()
+    response.headers[VERSION_HEADER] = predictor.version
     customer = predictor.get_customer_by_id(user_id)
     
     if customer is None:
@@ -100,7 +176,8 @@ async def get_customer(user_id: int):
         past_purchase_count=int(customer['past_purchase_count']),
         historical_opens=int(customer['historical_opens']),
         historical_clicks=int(customer['historical_clicks']),
-        historical_conversions=int(customer['historical_conversions'])
+        historical_conversions=int(customer['historical_conversions']),
+        historical_sends=int(customer['historical_sends'])
     )
 
 
@@ -117,56 +194,583 @@ async def get_campaign_types():
     }
 
 
-@app.post("/simulate", response_model=SimulationResponse)
-async def simulate_campaign(request: SimulationRequest):
+def versioned(payload: dict, predictor) -> dict:
+    """Response payload tagged with the predictor version that produced it."""
+    payload["model_version"] = predictor.version
+    return payload
+
+
+# Detail levels that need no per-customer rows
+AGGREGATE_DETAILS = (DetailLevel.SUMMARY, DetailLevel.BREAKDOWN)
+
+
+def simulation_payload(batch: PredictionBatch, request: SimulationRequest, predictor) -> dict:
+    """Response body for a simulation at the requested level of detail."""
+    payload = {"summary": batch.summary(), "predictions": []}
+    
+    if request.detail == DetailLevel.FULL:
+        payload["predictions"] = batch.to_records()
+    elif request.detail == DetailLevel.BREAKDOWN:
+        payload["breakdowns"] = {col: batch.breakdown(col) for col in BREAKDOWN_COLUMNS}
+    elif request.detail == DetailLevel.SAMPLE:
+        payload["predictions"] = batch.to_records(batch.sample_index(request.sample_size))
+    elif request.detail == DetailLevel.TOP:
+        payload["predictions"] = batch.to_records(
+            batch.top_index(request.sample_size, request.rank_by.value)
+        )
+    elif request.detail == DetailLevel.ROLLUP:
+        payload["rollup"], payload["rollups"] = predictor.rollup(batch)
+    return payload
+
+
+def resolve_audience(request):
     """
-    Run a campaign simulation against selected customers.
+    Customer IDs a simulation request targets, plus bytes identifying them.
     
-    Returns individual predictions and aggregate metrics.
+    Saved audiences are immutable, so their digest stands in for the members.
     """
+    if request.audience_id:
+        audience = audience_store.get(request.audience_id)
+        if audience is None:
+            raise HTTPException(status_code=404, detail="Audience not found")
+        return audience.user_ids, audience.digest.encode()
     if not request.customer_ids:
         raise HTTPException(status_code=400, detail="No customers selected")
+    return request.customer_ids, np.asarray(request.customer_ids, dtype=np.int64).tobytes()
+
+
+def request_fingerprint(predictor, request, members: bytes) -> str:
+    """
+    Cache key for a simulation request under the live model and twin data.
     
+    Outcomes are sampled with a fixed seed, so the same request against the
+    same versions always produces the same response.
+    """
+    options = request.model_dump_json(exclude={"customer_ids"}).encode()
+    twins = predictor.twins
+    # Rollups and journeys read the live history counters, so ingested events invalidate them
+    reads_counters = isinstance(request, JourneyRequest) or \
+        getattr(request, "detail", None) == DetailLevel.ROLLUP
+    data_version = f"{twins.version}.{twins.counters_version}" if reads_counters else str(twins.version)
+    return fingerprint(
+        type(request).__name__.encode(),
+        predictor.version.encode(),
+        data_version.encode(),
+        options,
+        members
+    )
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Whether an If-None-Match header covers etag (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    return "*" in tags or etag in tags
+
+
+def serialized(run, model, request, predictor, customer_ids) -> bytes:
+    """Run a simulation and serialize it through its response model; runs on the pool."""
+    payload = versioned(run(request, predictor, customer_ids), predictor)
+    with stage("serialize"):
+        return model.model_validate(payload).model_dump_json().encode()
+
+
+async def cached_simulation(request, if_none_match: Optional[str], run, model) -> Response:
+    """
+    Serve a simulation from the result cache, or run it on the pool and cache it.
+    
+    Responses carry an ETag of the request fingerprint; a matching
+    If-None-Match gets 304 without touching the cache or the pool.
+    """
+    customer_ids, members = resolve_audience(request)
     predictor = get_predictor()
+    key = request_fingerprint(predictor, request, members)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, VERSION_HEADER: predictor.version}
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
     
-    # Run predictions
-    predictions = predictor.predict(
-        customer_ids=request.customer_ids,
+    body = result_cache.get(key)
+    if body is None:
+        body = await simulation_pool.run(serialized, run, model, request, predictor, customer_ids)
+        result_cache.put(key, body, size=len(body))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.post("/simulate", response_model=SimulationResponse)
+async def simulate_campaign(request: SimulationRequest, if_none_match: Optional[str] = Header(None)):
+    """
+    Run a campaign simulation against selected customers.
+    
+    Returns aggregate metrics plus, depending on request.detail, every
+    prediction, per-group breakdowns, a random sample, or the top-K rows.
+    Repeat requests are answered from the result cache.
+    """
+    return await cached_simulation(request, if_none_match, run_simulation, SimulationResponse)
+
+
+def run_simulation(request: SimulationRequest, predictor, customer_ids) -> dict:
+    """Score a simulation; runs on the simulation pool."""
+    campaign = dict(
         campaign_type=request.campaign.type.value,
         subject_line=request.campaign.subject_line,
         send_hour=request.campaign.send_hour
     )
     
-    if not predictions:
+    if request.detail in AGGREGATE_DETAILS and len(customer_ids) >= SHARD_MIN_TWINS:
+        # Very large aggregate-only requests are sampled across worker processes
+        batch = predictor.simulate_aggregate(customer_ids=customer_ids, **campaign)
+    else:
+        # Run predictions, kept columnar until serialization
+        batch = predictor.predict_batch(customer_ids=customer_ids, **campaign)
+    
+    if len(batch) == 0:
+        raise HTTPException(status_code=404, detail="No customers found for given IDs")
+    
+    return simulation_payload(batch, request, predictor)
+
+
+@app.post("/simulate/batch", response_model=BatchSimulationResponse)
+async def simulate_batch(request: BatchSimulationRequest, if_none_match: Optional[str] = Header(None)):
+    """
+    Run several campaign variants against one audience.
+    
+    Returns a summary per variant plus pairwise lift and significance.
+    """
+    return await cached_simulation(request, if_none_match, run_batch_simulation, BatchSimulationResponse)
+
+
+def run_batch_simulation(request: BatchSimulationRequest, predictor, customer_ids) -> dict:
+    """Score every variant and compare them; runs on the simulation pool."""
+    batches = predictor.predict_variants(
+        customer_ids=customer_ids,
+        campaigns=[(c.type.value, c.subject_line, c.send_hour) for c in request.variants]
+    )
+    
+    if len(batches[0]) == 0:
+        raise HTTPException(status_code=404, detail="No customers found for given IDs")
+    
+    summaries = [batch.summary() for batch in batches]
+    return {"summaries": summaries, "comparisons": compare_variants(summaries)}
+
+
+@app.post("/simulate/monte-carlo", response_model=MonteCarloResponse)
+async def simulate_monte_carlo(request: MonteCarloRequest, if_none_match: Optional[str] = Header(None)):
+    """
+    Expected outcomes with percentile intervals and tail risks for a campaign.
+    
+    With replicates=0 the intervals come from the exact mean and variance of
+    the Poisson-binomial totals plus a skewness correction, at about the cost
+    of one simulation; otherwise from that many replicate draws.
+    """
+    if any(not 0 < q < 100 for q in request.percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    if any(not 0 <= x <= 1 for xs in request.thresholds.values() for x in xs):
+        raise HTTPException(status_code=400, detail="thresholds must be rates between 0 and 1")
+    if request.replicates:
+        check_replicate_budget(request)
+    
+    return await cached_simulation(request, if_none_match, run_monte_carlo, MonteCarloResponse)
+
+
+def check_replicate_budget(request: MonteCarloRequest):
+    """
+    Reject replicate requests whose draws would exceed MAX_REPLICATE_DRAWS.
+    
+    Draws scale with distinct profiles, bounded here by the audience size
+    and the store's profile count, so the check runs before any scoring.
+    """
+    if request.audience_id:
+        audience = audience_store.get(request.audience_id)
+        if audience is None:
+            raise HTTPException(status_code=404, detail="Audience not found")
+        size = audience.size
+    else:
+        size = len(request.customer_ids)
+    profiles = min(size, len(get_predictor().twins.profiles))
+    draws = request.replicates * profiles * len(TARGETS)
+    if draws > MAX_REPLICATE_DRAWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{request.replicates} replicates over up to {profiles} profiles need {draws} draws; "
+                   f"at most {MAX_REPLICATE_DRAWS} allowed (use fewer replicates or replicates=0)"
+        )
+
+
+def run_monte_carlo(request: MonteCarloRequest, predictor, customer_ids) -> dict:
+    """Compute outcome distributions; runs on the simulation pool."""
+    total, targets = predictor.outcome_distribution(
+        customer_ids=customer_ids,
+        campaign_type=request.campaign.type.value,
+        subject_line=request.campaign.subject_line,
+        send_hour=request.campaign.send_hour,
+        percentiles=request.percentiles,
+        thresholds={target.value: xs for target, xs in request.thresholds.items()},
+        replicates=request.replicates,
+        seed=request.seed
+    )
+    if total == 0:
+        raise HTTPException(status_code=404, detail="No customers found for given IDs")
+    
+    return {
+        "total_customers": total,
+        "method": "replicates" if request.replicates else "analytic",
+        "replicates": request.replicates,
+        "targets": targets
+    }
+
+
+@app.post("/simulate/journey", response_model=JourneyResponse)
+async def simulate_journey(request: JourneyRequest, if_none_match: Optional[str] = Header(None)):
+    """
+    Send a schedule of campaigns to the same customers, one step after another.
+    
+    Unsubscribers drop out of later steps and conversions raise
+    past_purchase_count before the next step is scored. Returns per-step
+    funnel metrics; with stream=true each step is sent as an NDJSON line
+    as soon as it completes, followed by a summary line. Streamed steps run
+    on the simulation pool, holding one queue slot for the whole journey.
+    """
+    if not request.stream:
+        return await cached_simulation(request, if_none_match, run_journey_simulation, JourneyResponse)
+    
+    customer_ids, _ = resolve_audience(request)
+    predictor = get_predictor()
+    positions = await simulation_pool.run(predictor.twins.positions, customer_ids)
+    if len(positions) == 0:
+        raise HTTPException(status_code=404, detail="No customers found for given IDs")
+    lines = simulation_pool.stream(
+        iter_journey_ndjson(predictor, positions, journey_steps(request), request.seed),
+        timeout=JOURNEY_STREAM_TIMEOUT_S
+    )
+    return StreamingResponse(journey_stream(lines), media_type="application/x-ndjson",
+                             headers={VERSION_HEADER: predictor.version})
+
+
+async def journey_stream(lines):
+    """Pass NDJSON lines through, ending with an 'error' line if the deadline passes."""
+    try:
+        async for line in lines:
+            yield line
+    except TimeoutError:
+        yield b'{"type":"error","detail":"Journey timed out"}\n'
+    finally:
+        # Frees the pool slot right away when the client disconnects
+        await lines.aclose()
+
+
+def journey_steps(request: JourneyRequest) -> list:
+    """(campaign_type, subject_line, send_hour) per journey step."""
+    return [(step.type.value, step.subject_line, step.send_hour) for step in request.steps]
+
+
+def run_journey_simulation(request: JourneyRequest, predictor, customer_ids) -> dict:
+    """Run a whole journey; runs on the simulation pool."""
+    positions = predictor.twins.positions(customer_ids)
+    if len(positions) == 0:
         raise HTTPException(status_code=404, detail="No customers found for given IDs")
     
-    # Calculate summary metrics
-    total = len(predictions)
-    opens = sum(1 for p in predictions if p['will_open'])
-    clicks = sum(1 for p in predictions if p['will_click'])
-    unsubs = sum(1 for p in predictions if p['will_unsubscribe'])
-    conversions = sum(1 for p in predictions if p['will_convert'])
-    
-    summary = SimulationSummary(
-        total_customers=total,
-        predicted_opens=opens,
-        predicted_clicks=clicks,
-        predicted_unsubscribes=unsubs,
-        predicted_conversions=conversions,
-        open_rate=round(opens / total, 4) if total > 0 else 0,
-        click_rate=round(clicks / total, 4) if total > 0 else 0,
-        unsubscribe_rate=round(unsubs / total, 4) if total > 0 else 0,
-        conversion_rate=round(conversions / total, 4) if total > 0 else 0
+    return run_journey(predictor, positions, journey_steps(request), request.seed)
+
+
+@app.post("/optimize/send-time", response_model=SweepResponse)
+async def optimize_send_time(request: SweepRequest, response: Response):
+    """
+    Sweep send hours, and optionally subject lengths, for one campaign type.
+    
+    Returns the expected-metric curve over the grid and the best point
+    overall and per interest segment.
+    """
+    if any(hour < 0 or hour > 23 for hour in request.send_hours):
+        raise HTTPException(status_code=400, detail="send_hours must be between 0 and 23")
+    if len(set(request.send_hours)) != len(request.send_hours):
+        raise HTTPException(status_code=400, detail="send_hours must not repeat")
+    
+    if request.min_subject_length or request.max_subject_length:
+        low = request.min_subject_length or 1
+        high = request.max_subject_length or low
+        if high < low:
+            raise HTTPException(status_code=400, detail="max_subject_length is below min_subject_length")
+        subject_lengths = list(range(low, high + 1, request.subject_length_step))
+    else:
+        subject_lengths = [len(request.subject_line)]
+    
+    points = len(request.send_hours) * len(subject_lengths)
+    if points > MAX_SWEEP_POINTS:
+        raise HTTPException(status_code=400,
+                            detail=f"Sweep grid has {points} points; at most {MAX_SWEEP_POINTS} allowed")
+    
+    result = await simulation_pool.run(run_sweep, request, subject_lengths)
+    response.headers[VERSION_HEADER] = result["model_version"]
+    return result
+
+
+def run_sweep(request: SweepRequest, subject_lengths: List[int]) -> dict:
+    """Evaluate the sweep grid; runs on the simulation pool."""
+    predictor = get_predictor()
+    result = sweep_campaign(
+        predictor,
+        customer_ids=request.customer_ids,
+        campaign_type=request.campaign_type.value,
+        send_hours=sorted(request.send_hours),
+        subject_lengths=subject_lengths,
+        metric=request.metric.value
     )
+    if result is None:
+        raise HTTPException(status_code=404, detail="No customers found for given IDs")
+    
+    return versioned(result, predictor)
+
+
+@app.post("/audiences", response_model=AudienceInfo, status_code=201)
+async def create_audience(request: AudienceCreate):
+    """
+    Save an audience from an ID list or from /customers-style filters.
     
-    customer_predictions = [
-        CustomerPrediction(**p) for p in predictions
-    ]
+    Filter audiences capture the matching twins at creation time.
+    """
+    if (request.user_ids is None) == (request.filters is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of user_ids or filters")
+    
+    if request.filters is not None:
+        filters = request.filters.model_dump(mode="json", exclude_none=True)
+        twins = get_predictor().twins
+        positions = twins.filter(**filters)
+        user_ids, source = twins.user_ids[positions], {"filters": filters}
+    else:
+        user_ids, source = request.user_ids, {"user_ids": len(request.user_ids)}
+    return await run_in_threadpool(save_audience, request.name, user_ids, source)
+
+
+@app.post("/audiences/upload", response_model=AudienceInfo, status_code=201)
+async def upload_audience(request: Request, name: str = Query(..., min_length=1, max_length=200)):
+    """
+    Save an audience from a raw body of user IDs separated by commas or whitespace.
     
-    return SimulationResponse(
-        summary=summary,
-        predictions=customer_predictions
+    Skips JSON parsing and per-item validation, for lists of millions of IDs.
+    """
+    body = await request.body()
+    # Parsing millions of IDs takes a while, so it stays off the event loop
+    return await run_in_threadpool(save_uploaded_audience, name, body)
+
+
+def save_uploaded_audience(name: str, body: bytes) -> dict:
+    """Parse an uploaded ID list and save it; runs in the threadpool."""
+    try:
+        user_ids = np.array(body.replace(b",", b" ").split(), dtype=np.int64)
+    except (ValueError, OverflowError):
+        # OverflowError: an ID beyond the int64 range
+        raise HTTPException(status_code=400, detail="Body must contain only integer user IDs")
+    return save_audience(name, user_ids, {"upload": len(user_ids)})
+
+
+@app.post("/audiences/combine", response_model=AudienceInfo, status_code=201)
+async def combine_audiences(request: AudienceCombine):
+    """Save the union, intersection or difference of saved audiences."""
+    try:
+        audience = await run_in_threadpool(
+            audience_store.combine, request.name, request.operation.value, request.audience_ids
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Audience {e.args[0]} not found")
+    except OverflowError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return audience.info()
+
+
+def save_audience(name: str, user_ids, source: dict, ttl: Optional[float] = None) -> dict:
+    try:
+        return audience_store.create(name, user_ids, source, ttl=ttl).info()
+    except OverflowError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/audiences", response_model=AudienceListResponse)
+async def list_audiences():
+    """Saved audiences, oldest first."""
+    return {"audiences": [audience.info() for audience in audience_store.list()]}
+
+
+@app.get("/audiences/{audience_id}", response_model=AudienceInfo)
+async def get_audience(audience_id: str):
+    audience = audience_store.get(audience_id)
+    if audience is None:
+        raise HTTPException(status_code=404, detail="Audience not found")
+    return audience.info()
+
+
+@app.delete("/audiences/{audience_id}", status_code=204)
+async def delete_audience(audience_id: str):
+    if not audience_store.delete(audience_id):
+        raise HTTPException(status_code=404, detail="Audience not found")
+    return Response(status_code=204)
+
+
+@app.post("/optimize/audience", response_model=AudienceOptimizeResponse)
+async def optimize_audience(request: AudienceOptimizeRequest, response: Response):
+    """
+    Choose who to send a campaign to.
+    
+    Scores every candidate twin (the whole base unless a candidate audience
+    is given) and selects with a partial sort over unique profiles. By
+    default the selection is kept as a saved audience that expires after
+    OPTIMIZED_AUDIENCE_TTL_S (201) and its ID and size are returned; the
+    user IDs themselves only with include_user_ids, up to MAX_INLINE_USER_IDS.
+    """
+    if request.objective == AudienceObjective.MAX_CONVERSIONS and request.unsub_budget is None:
+        raise HTTPException(status_code=400, detail="max_conversions needs unsub_budget")
+    if request.objective == AudienceObjective.TOP_N and request.n is None:
+        raise HTTPException(status_code=400, detail="top_n needs n")
+    if request.include_user_ids and (request.n or 0) > MAX_INLINE_USER_IDS:
+        raise HTTPException(status_code=400, detail=inline_limit_detail())
+    
+    candidate_ids = None
+    if request.candidates_audience_id:
+        audience = audience_store.get(request.candidates_audience_id)
+        if audience is None:
+            raise HTTPException(status_code=404, detail="Audience not found")
+        candidate_ids = audience.user_ids
+    
+    result = await simulation_pool.run(run_audience_optimization, request, candidate_ids)
+    response.headers[VERSION_HEADER] = result["model_version"]
+    if result.get("audience") is not None:
+        response.status_code = 201
+    return result
+
+
+def run_audience_optimization(request: AudienceOptimizeRequest, candidate_ids) -> dict:
+    """Select the audience and save it if asked; runs on the simulation pool."""
+    predictor = get_predictor()
+    if candidate_ids is None:
+        positions = np.arange(len(predictor.twins))
+    else:
+        positions = predictor.twins.positions(candidate_ids)
+    
+    result = select_audience(
+        predictor,
+        positions,
+        campaign_type=request.campaign.type.value,
+        subject_length=len(request.campaign.subject_line),
+        send_hour=request.campaign.send_hour,
+        objective=request.objective.value,
+        unsub_budget=request.unsub_budget,
+        size=request.n,
+        rank_by=request.rank_by.value
     )
+    user_ids = result.pop("user_ids")
+    if request.include_user_ids:
+        if len(user_ids) > MAX_INLINE_USER_IDS:
+            raise HTTPException(status_code=400, detail=inline_limit_detail())
+        result["user_ids"] = user_ids.tolist()
+    if not request.save:
+        return versioned(result, predictor)
+    
+    source = {
+        "objective": request.objective.value,
+        "campaign": request.campaign.model_dump(mode="json"),
+        "unsub_budget": request.unsub_budget,
+        "n": request.n,
+        "model_version": predictor.version
+    }
+    name = request.name or f"{request.objective.value} for {request.campaign.type.value}"
+    result["audience"] = save_audience(name, user_ids, source, ttl=OPTIMIZED_AUDIENCE_TTL_S)
+    return versioned(result, predictor)
+
+
+def inline_limit_detail() -> str:
+    return (f"Selection too large to return inline (at most {MAX_INLINE_USER_IDS} user IDs); "
+            "use the saved audience instead")
+
+
+@app.get("/health/queue")
+async def queue_status():
+    """Simulation pool occupancy, for load balancers and dashboards."""
+    return {
+        "workers": simulation_pool.max_workers,
+        "pending": simulation_pool.pending,
+        "max_pending": simulation_pool.max_pending
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request and stage latency histograms, cache hit rates and model version (Prometheus format)."""
+    lines = request_seconds.render() + stage_seconds.render()
+    lines += gauge("twin_simulation_pending", "Simulation jobs running or queued",
+                   [({}, simulation_pool.pending)])
+    lines += gauge("twin_event_ingest_pending", "Event ingestion jobs running or queued",
+                   [({}, event_pool.pending)])
+    lines += gauge("twin_reload_in_progress", "Whether a model reload is running",
+                   [({}, int(registry.loading))])
+    
+    predictor = registry.current
+    if predictor is not None:
+        lines += gauge("twin_model_info", "Live model/data version", [({"version": predictor.version}, 1)])
+        lines += gauge("twin_store_twins", "Twins in the live store", [({}, len(predictor.twins))])
+        lines += cache_lines({
+            "campaign_probs": predictor.campaign_cache,
+            "twin_filters": predictor.twins.filter_cache,
+            "simulation_results": result_cache
+        })
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.post("/events", response_model=IngestResponse)
+async def ingest_events(batch: EventBatch):
+    """
+    Record send/open/click/convert events and update twin counters in place.
+    
+    Events are appended to the event log and folded into the live twins'
+    historical_* counters; the log is compacted in the background. Ingestion
+    runs on its own small pool, so busy simulations never reject event writes.
+    """
+    events = batch.events
+    user_ids = np.fromiter((e.user_id for e in events), dtype=np.int64, count=len(events))
+    kinds = encode_kinds([e.event.value for e in events])
+    applied = await event_pool.run(
+        event_store.ingest, registry.twins, user_ids, kinds,
+        [e.campaign_id for e in events], [e.timestamp for e in events]
+    )
+    return IngestResponse(received=len(events), applied=applied)
+
+
+@app.post("/admin/reload", status_code=202)
+async def reload_models(wait: bool = False):
+    """
+    Load the current CSV/pickle or snapshot as a new version and swap it in.
+    
+    Runs in the background unless wait is set; requests keep being served
+    by the live version until the new one has passed its canary.
+    """
+    if wait:
+        started = await run_in_threadpool(registry.reload, True)
+    else:
+        started = registry.reload()
+    if not started:
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    return registry.status()
+
+
+@app.get("/admin/models")
+async def model_status():
+    """Live version, reload state and recent version history."""
+    return registry.status()
+
+
+@app.on_event("startup")
+def load_predictor():
+    # Pay the load cost before serving instead of on the first request
+    if os.environ.get("TWIN_EAGER_LOAD", "1") != "0":
+        get_predictor()
+
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    simulation_pool.shutdown()
+    event_pool.shutdown()
+    shutdown_sharded_simulator()
 
 
 @app.get("/segments")
@@ -0,0 +1,138 @@
+"""
+In-process request and stage metrics, rendered in the Prometheus text format.
+
+Stages are timed with the stage() context manager. Every duration goes into
+a histogram, and, while a request is being traced, into that request's list
+of timings for the Server-Timing header. The request's list travels in a
+context variable, so stages timed on the simulation pool's threads are
+attributed to the request that submitted them.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.8, 1.0, 2.5, 5.0, 10.0)
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.environ.get("TWIN_SERVER_TIMING", "0") != "0"
+
+# (stage, seconds) pairs timed for the current request, or None when not tracing
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "twin_timings", default=None
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for label_values, buckets, total, count in series:
+            labels = _labels(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+request_seconds = Histogram("twin_request_seconds", "HTTP request latency",
+                            ("method", "route", "status"))
+stage_seconds = Histogram("twin_stage_seconds", "Time spent in each simulation stage", ("stage",))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a named stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def start_trace() -> List[Tuple[str, float]]:
+    """Collect stage timings for the current request; returns the list they go into."""
+    timings: List[Tuple[str, float]] = []
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value; repeated stages are summed."""
+    merged: Dict[str, float] = {}
+    for name, elapsed in list(timings):
+        merged[name] = merged.get(name, 0.0) + elapsed
+    parts = [f"{name};dur={elapsed * 1000:.2f}" for name, elapsed in merged.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def gauge(name: str, help: str, samples: List[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Prometheus lines for a gauge with (labels, value) samples."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        label_text = _labels(labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def cache_lines(caches: Dict[str, object]) -> List[str]:
+    """Hit, miss and size series for named LRUCache instances."""
+    lines = ["# HELP twin_cache_hits_total Cache lookups that found an entry",
+             "# TYPE twin_cache_hits_total counter"]
+    lines += [f'twin_cache_hits_total{{cache="{name}"}} {cache.hits}' for name, cache in caches.items()]
+    lines += ["# HELP twin_cache_misses_total Cache lookups that found nothing",
+              "# TYPE twin_cache_misses_total counter"]
+    lines += [f'twin_cache_misses_total{{cache="{name}"}} {cache.misses}' for name, cache in caches.items()]
+    lines += gauge("twin_cache_hit_ratio", "Share of cache lookups that hit", [
+        ({'cache': name}, round(cache.hits / max(cache.hits + cache.misses, 1), 4))
+        for name, cache in caches.items()
+    ])
+    lines += gauge("twin_cache_entries", "Entries held in each cache", [
+        ({'cache': name}, len(cache)) for name, cache in caches.items()
+    ])
+    return lines
+
+
+def _labels(pairs) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
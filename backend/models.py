@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from enum import Enum
 
 
@@ -23,6 +23,22 @@ class CampaignType(str, Enum):
     CART_ABANDONMENT = "Cart Abandonment"
 
 
+class DetailLevel(str, Enum):
+    FULL = "full"            # every customer prediction
+    SUMMARY = "summary"      # aggregates only
+    BREAKDOWN = "breakdown"  # aggregates plus per-segment/income rollups
+    SAMPLE = "sample"        # aggregates plus a random sample of predictions
+    TOP = "top"              # aggregates plus the top-K predictions by confidence
+    ROLLUP = "rollup"        # aggregates plus expected-value rollups and historical uplift
+
+
+class PredictionTarget(str, Enum):
+    OPEN = "open"
+    CLICK = "click"
+    UNSUB = "unsub"
+    CONVERT = "convert"
+
+
 class Customer(BaseModel):
     user_id: int
     name: str
@@ -34,6 +50,7 @@ class Customer(BaseModel):
     historical_opens: Optional[int] = None
     historical_clicks: Optional[int] = None
     historical_conversions: Optional[int] = None
+    historical_sends: Optional[int] = None
 
 
 class Campaign(BaseModel):
@@ -42,9 +59,76 @@ class Campaign(BaseModel):
     send_hour: int  # 8-21
 
 
+class EventKind(str, Enum):
+    SEND = "send"
+    OPEN = "open"
+    CLICK = "click"
+    CONVERT = "convert"
+
+
+class Event(BaseModel):
+    user_id: int
+    event: EventKind
+    campaign_id: Optional[str] = None
+    timestamp: Optional[float] = None  # unix seconds; defaults to ingestion time
+
+
+class EventBatch(BaseModel):
+    events: List[Event] = Field(..., max_length=100000)
+
+
+class IngestResponse(BaseModel):
+    received: int
+    applied: int  # events for known twins; others are logged only
+
+
 class SimulationRequest(BaseModel):
-    customer_ids: List[int]
+    customer_ids: List[int] = []
+    audience_id: Optional[str] = None  # saved audience to use instead of customer_ids
+    campaign: Campaign
+    detail: DetailLevel = DetailLevel.FULL
+    sample_size: int = Field(100, ge=1, le=10000)  # rows for sample/top
+    rank_by: PredictionTarget = PredictionTarget.CONVERT  # confidence used for top
+
+
+class MonteCarloRequest(BaseModel):
+    customer_ids: List[int] = []
+    audience_id: Optional[str] = None  # saved audience to use instead of customer_ids
     campaign: Campaign
+    # 0 uses the analytic approximation; otherwise replicate simulations to draw
+    replicates: int = Field(0, ge=0, le=20000)
+    percentiles: List[float] = Field(default_factory=lambda: [5.0, 50.0, 95.0], min_length=1, max_length=20)
+    # Rates per target to report P(rate > threshold) for, e.g. {"unsub": [0.05]}
+    thresholds: Dict[PredictionTarget, List[float]] = {}
+    seed: int = 42
+
+
+class PercentileInterval(BaseModel):
+    percentile: float
+    count: float
+    rate: float
+
+
+class TailRisk(BaseModel):
+    threshold: float
+    probability: float  # P(rate > threshold)
+
+
+class TargetDistribution(BaseModel):
+    target: PredictionTarget
+    expected_count: float
+    expected_rate: float
+    std_rate: float
+    intervals: List[PercentileInterval]
+    tail_risks: List[TailRisk]
+
+
+class MonteCarloResponse(BaseModel):
+    total_customers: int
+    method: str  # "analytic" or "replicates"
+    replicates: int
+    targets: List[TargetDistribution]
+    model_version: Optional[str] = None
 
 
 class CustomerPrediction(BaseModel):
@@ -75,9 +159,226 @@ class SimulationSummary(BaseModel):
     conversion_rate: float
 
 
+class GroupSummary(SimulationSummary):
+    value: str
+
+
+class GroupRollup(BaseModel):
+    value: str
+    total_customers: int
+    # Expected counts and rates: sums of predicted probabilities, not samples
+    expected_opens: float
+    expected_clicks: float
+    expected_unsubscribes: float
+    expected_conversions: float
+    open_rate: float
+    click_rate: float
+    unsubscribe_rate: float
+    conversion_rate: float
+    # Per-send rates from the twins' historical_* counters; None without sends
+    historical_sends: int
+    baseline_open_rate: Optional[float] = None
+    baseline_click_rate: Optional[float] = None
+    baseline_conversion_rate: Optional[float] = None
+    # Expected rate minus baseline (uplift) and relative to it (lift)
+    open_uplift: Optional[float] = None
+    click_uplift: Optional[float] = None
+    conversion_uplift: Optional[float] = None
+    open_lift: Optional[float] = None
+    click_lift: Optional[float] = None
+    conversion_lift: Optional[float] = None
+
+
 class SimulationResponse(BaseModel):
     summary: SimulationSummary
-    predictions: List[CustomerPrediction]
+    predictions: List[CustomerPrediction] = []
+    # Rollups keyed by column name, only for detail=breakdown
+    breakdowns: Optional[Dict[str, List[GroupSummary]]] = None
+    # Only for detail=rollup: the whole audience, then per interest_segment,
+    # income_bracket and age_bucket
+    rollup: Optional[GroupRollup] = None
+    rollups: Optional[Dict[str, List[GroupRollup]]] = None
+    model_version: Optional[str] = None
+
+
+class BatchSimulationRequest(BaseModel):
+    customer_ids: List[int] = []
+    audience_id: Optional[str] = None  # saved audience to use instead of customer_ids
+    variants: List[Campaign] = Field(..., min_length=1, max_length=50)
+
+
+class VariantComparison(BaseModel):
+    variant_a: int
+    variant_b: int
+    metric: str
+    lift: Optional[float] = None  # relative to variant_a; None if its rate is 0
+    z_score: float
+    p_value: float
+    significant: bool
+
+
+class BatchSimulationResponse(BaseModel):
+    summaries: List[SimulationSummary]  # in variant order
+    comparisons: List[VariantComparison]
+    model_version: Optional[str] = None
+
+
+class SweepRequest(BaseModel):
+    customer_ids: List[int] = []  # empty sweeps the whole twin base
+    campaign_type: CampaignType
+    subject_line: str
+    # Distinct hours of the day, 0-23
+    send_hours: List[int] = Field(default_factory=lambda: list(range(8, 22)), min_length=1, max_length=24)
+    # Optional inclusive subject length range; otherwise len(subject_line) is used
+    min_subject_length: Optional[int] = Field(None, ge=1, le=200)
+    max_subject_length: Optional[int] = Field(None, ge=1, le=200)
+    subject_length_step: int = Field(5, ge=1)
+    metric: PredictionTarget = PredictionTarget.OPEN
+
+
+class SweepPoint(BaseModel):
+    send_hour: int
+    subject_length: int
+    open_rate: float
+    click_rate: float
+    unsubscribe_rate: float
+    conversion_rate: float
+
+
+class SweepBest(BaseModel):
+    send_hour: int
+    subject_length: int
+    expected_rate: float
+
+
+class SegmentSweepBest(SweepBest):
+    segment: str
+    total_customers: int
+
+
+class SweepResponse(BaseModel):
+    metric: PredictionTarget
+    total_customers: int
+    curve: List[SweepPoint]
+    best: SweepBest
+    best_by_segment: List[SegmentSweepBest]
+    model_version: Optional[str] = None
+
+
+class AudienceFilter(BaseModel):
+    segment: Optional[InterestSegment] = None
+    income: Optional[IncomeLevel] = None
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+
+
+class AudienceCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    # Exactly one of these; filters snapshot the matching twins at creation time
+    user_ids: Optional[List[int]] = None
+    filters: Optional[AudienceFilter] = None
+
+
+class SetOperation(str, Enum):
+    UNION = "union"
+    INTERSECT = "intersect"
+    DIFFERENCE = "difference"  # first audience minus the others
+
+
+class AudienceCombine(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    operation: SetOperation
+    audience_ids: List[str] = Field(..., min_length=2, max_length=20)
+
+
+class AudienceInfo(BaseModel):
+    audience_id: str
+    name: str
+    size: int
+    source: Dict
+    created_at: float
+    expires_at: Optional[float] = None  # audiences with a TTL are deleted after this
+    encoding: str  # "sorted" or "bitset"
+    nbytes: int
+
+
+class AudienceListResponse(BaseModel):
+    audiences: List[AudienceInfo]
+
+
+class AudienceObjective(str, Enum):
+    MAX_CONVERSIONS = "max_conversions"  # most expected conversions within unsub_budget
+    TOP_N = "top_n"                      # the n best twins by rank_by
+
+
+class AudienceOptimizeRequest(BaseModel):
+    campaign: Campaign
+    objective: AudienceObjective
+    unsub_budget: Optional[float] = Field(None, ge=0)  # expected unsubscribes, for max_conversions
+    n: Optional[int] = Field(None, ge=1)               # audience size, for top_n
+    rank_by: PredictionTarget = PredictionTarget.CONVERT
+    # Saved audience to choose from; the whole twin base otherwise
+    candidates_audience_id: Optional[str] = None
+    # Keep the selection as a saved audience (expiring after a TTL)
+    save: bool = True
+    name: Optional[str] = Field(None, max_length=200)
+    # Also return the selected user IDs inline; refused for large selections
+    include_user_ids: bool = False
+
+
+class AudienceOptimizeResponse(BaseModel):
+    audience: Optional[AudienceInfo] = None  # only with save=true
+    user_ids: Optional[List[int]] = None     # only with include_user_ids=true
+    objective: AudienceObjective
+    candidates: int
+    selected: int
+    expected_opens: float
+    expected_clicks: float
+    expected_unsubscribes: float
+    expected_conversions: float
+    model_version: Optional[str] = None
+
+
+class JourneyRequest(BaseModel):
+    customer_ids: List[int] = []
+    audience_id: Optional[str] = None  # saved audience to use instead of customer_ids
+    # Campaigns sent in order; twins who unsubscribe are skipped by later steps
+    steps: List[Campaign] = Field(..., min_length=1, max_length=100)
+    seed: int = 42
+    # Stream one NDJSON line per step as it completes instead of one JSON response
+    stream: bool = False
+
+
+class JourneyStep(SimulationSummary):
+    step: int
+    campaign_type: CampaignType
+    subject_line: str
+    send_hour: int
+    remaining_customers: int  # still subscribed after this step
+    cumulative_unsubscribes: int
+    cumulative_conversions: int
+    elapsed_ms: float
+
+
+class JourneySummary(BaseModel):
+    total_customers: int
+    steps: int
+    total_sends: int
+    total_opens: int
+    total_clicks: int
+    total_unsubscribes: int
+    total_conversions: int
+    retained_customers: int
+    converted_customers: int  # twins converting at least once
+    # Audience totals of the history counters after the journey
+    historical_totals: Dict[str, int]
+    elapsed_ms: float
+
+
+class JourneyResponse(BaseModel):
+    steps: List[JourneyStep]
+    summary: JourneySummary
+    model_version: Optional[str] = None
 
 
 class CustomerListResponse(BaseModel):
@@ -85,3 +386,5 @@ class CustomerListResponse(BaseModel):
     total: int
     page: int
     page_size: int
+    # user_id to pass as after_user_id for the next page, if any
+    next_cursor: Optional[int] = None
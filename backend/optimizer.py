@@ -0,0 +1,201 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+from results import TARGETS
+
+# Hours a campaign can be scheduled at (see Campaign.send_hour)
+SEND_HOURS = list(range(8, 22))
+
+# Largest send_hour x subject_length grid one sweep may evaluate; bigger grids
+# would outlast the simulation pool's timeout on a large audience
+MAX_SWEEP_POINTS = 500
+
+# Rate field reported for each target
+RATE_FIELDS = {
+    'open': 'open_rate',
+    'click': 'click_rate',
+    'unsub': 'unsubscribe_rate',
+    'convert': 'conversion_rate'
+}
+
+# Profiles ranked by the first partial sort when selecting an audience; doubled as needed
+INITIAL_TOP_K = 1024
+
+
+def audience_positions(predictor, customer_ids: Optional[List[int]]) -> np.ndarray:
+    """Twin positions for the given IDs, or the whole twin base if none are given."""
+    if customer_ids:
+        return predictor.twins.positions(customer_ids)
+    return np.arange(len(predictor.twins))
+
+
+def sweep_campaign(
+    predictor,
+    customer_ids: Optional[List[int]],
+    campaign_type: str,
+    send_hours: List[int],
+    subject_lengths: List[int],
+    metric: str
+) -> dict:
+    """
+    Expected metrics over a send_hour x subject_length grid in one model pass.
+
+    Probabilities are computed per unique twin profile and weighted by how
+    many audience twins share it, so the grid costs one stacked scoring of
+    the audience's profiles rather than one simulation per grid point.
+    Minimized metrics (unsub) pick the lowest expected rate as best.
+    """
+    positions = audience_positions(predictor, customer_ids)
+    total = len(positions)
+    if total == 0:
+        return None
+
+    profile_ids, weights = np.unique(predictor.twins.profile_ids[positions], return_counts=True)
+    grid = [(hour, length) for length in subject_lengths for hour in send_hours]
+    probs = np.stack(predictor.variant_probs(
+        profile_ids,
+        [(campaign_type, length, hour) for hour, length in grid],
+        cache=False
+    ))  # (grid, targets, profiles)
+
+    # Expected positives per grid point and target, overall and per segment
+    segments, segment_of = np.unique(
+        predictor.twins.profiles['interest_segment'].to_numpy()[profile_ids], return_inverse=True
+    )
+    membership = np.zeros((len(profile_ids), len(segments)))
+    membership[np.arange(len(profile_ids)), segment_of] = weights
+    segment_totals = membership.sum(axis=0)
+
+    rates = probs @ weights / total                          # (grid, targets)
+    segment_rates = probs @ membership / segment_totals      # (grid, targets, segments)
+
+    target = TARGETS.index(metric)
+    pick = np.argmin if metric == 'unsub' else np.argmax
+
+    curve = [
+        dict({'send_hour': hour, 'subject_length': length},
+             **{RATE_FIELDS[t]: round(float(rates[g, i]), 4) for i, t in enumerate(TARGETS)})
+        for g, (hour, length) in enumerate(grid)
+    ]
+    best = int(pick(rates[:, target]))
+    best_by_segment = []
+    for s, segment in enumerate(segments):
+        g = int(pick(segment_rates[:, target, s]))
+        best_by_segment.append({
+            'segment': str(segment),
+            'total_customers': int(segment_totals[s]),
+            'send_hour': grid[g][0],
+            'subject_length': grid[g][1],
+            'expected_rate': round(float(segment_rates[g, target, s]), 4)
+        })
+
+    return {
+        'metric': metric,
+        'total_customers': total,
+        'curve': curve,
+        'best': {
+            'send_hour': grid[best][0],
+            'subject_length': grid[best][1],
+            'expected_rate': round(float(rates[best, target]), 4)
+        },
+        'best_by_segment': best_by_segment
+    }
+
+
+def top_order(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first, from a partial sort."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def ranked_prefix(scores: np.ndarray, costs: np.ndarray, limit: float) -> Tuple[np.ndarray, int, float]:
+    """
+    Items by descending score, and how many of them fit in a cost limit.
+
+    Only the top k items are ever sorted; k starts at INITIAL_TOP_K and
+    doubles until the limit is reached inside the ranked prefix, so the
+    work follows the size of the selection rather than the candidate pool.
+    Returns (ranked items, whole items that fit, cost of those items).
+    """
+    k = min(INITIAL_TOP_K, len(scores))
+    while True:
+        order = top_order(scores, k)
+        spent = np.cumsum(costs[order])
+        fit = int(np.searchsorted(spent, limit, side='right'))
+        if fit < len(order) or k >= len(scores):
+            return order, fit, float(spent[fit - 1]) if fit else 0.0
+        k = min(k * 2, len(scores))
+
+
+def select_audience(
+    predictor,
+    positions: np.ndarray,
+    campaign_type: str,
+    subject_length: int,
+    send_hour: int,
+    objective: str,
+    unsub_budget: Optional[float] = None,
+    size: Optional[int] = None,
+    rank_by: str = 'convert'
+) -> dict:
+    """
+    Pick the twins among positions that best serve a campaign objective.
+
+    'max_conversions' maximizes expected conversions while expected
+    unsubscribes stay within unsub_budget, taking twins greedily by
+    conversion-per-unsubscribe (the fractional knapsack optimum, exact up to
+    one partially taken profile). 'top_n' takes the size twins with the
+    highest expected rank_by rate (lowest for unsub).
+
+    Twins sharing a profile share their probabilities, so ranking happens
+    over the candidates' unique profiles and only the final membership test
+    touches every twin.
+    """
+    twins = predictor.twins
+    probs = predictor.variant_probs(
+        np.arange(len(twins.profiles)), [(campaign_type, subject_length, send_hour)]
+    )[0]
+    candidate_profiles = twins.profile_ids[positions]
+    counts = np.bincount(candidate_profiles, minlength=len(twins.profiles))
+    present = np.flatnonzero(counts)
+
+    if objective == 'max_conversions':
+        unsub, convert = probs[TARGETS.index('unsub')][present], probs[TARGETS.index('convert')][present]
+        with np.errstate(divide='ignore'):
+            scores = np.where(unsub > 0, convert / unsub, np.inf)
+        unit_costs, limit = unsub, unsub_budget
+    else:
+        rates = probs[TARGETS.index(rank_by)][present]
+        scores = -rates if rank_by == 'unsub' else rates
+        unit_costs, limit = np.ones(len(present)), size
+
+    order, fit, spent = ranked_prefix(scores, unit_costs * counts[present], limit)
+
+    # Whole profiles that fit, plus as many twins of the next one as the remainder allows
+    taken = np.zeros(len(twins.profiles), dtype=np.int64)
+    taken[present[order[:fit]]] = counts[present[order[:fit]]]
+    if fit < len(order):
+        nxt = order[fit]
+        partial = int((limit - spent) // unit_costs[nxt]) if unit_costs[nxt] > 0 else 0
+        taken[present[nxt]] = min(partial, counts[present[nxt]])
+
+    selected = taken[candidate_profiles] == counts[candidate_profiles]
+    partial_profiles = np.flatnonzero((taken > 0) & (taken < counts))
+    for profile in partial_profiles:
+        # Lowest user IDs first, so the selection is deterministic
+        rows = np.flatnonzero(candidate_profiles == profile)[:taken[profile]]
+        selected[rows] = True
+
+    expected = probs @ taken
+    return {
+        'objective': objective,
+        'candidates': int(len(positions)),
+        'selected': int(taken.sum()),
+        'user_ids': twins.user_ids[positions[selected]],
+        'expected_opens': round(float(expected[0]), 2),
+        'expected_clicks': round(float(expected[1]), 2),
+        'expected_unsubscribes': round(float(expected[2]), 2),
+        'expected_conversions': round(float(expected[3]), 2)
+    }
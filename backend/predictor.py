@@ -1,22 +1,81 @@
+import hashlib
+import json
 import joblib
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-# Path to the trained models
-BRAIN_PATH = Path(__file__).parent.parent / "ecommerce_brain.pkl"
-DATA_PATH = Path(__file__).parent.parent / "ecommerce_marketing_data.csv"
+from cache import LRUCache
+from metrics import stage
+from twin_store import TwinStore, DATA_PATH, read_raw_data
+from results import (
+    PredictionBatch, AggregateResult, TARGETS, MODEL_KEYS, PREDICTION_TWIN_COLUMNS,
+    sample_outcomes, outcome_distribution, rollup, age_bucket_codes, AGE_BUCKET_LABELS,
+    BREAKDOWN_COLUMNS, HISTORY_ORDER
+)
+from sharding import get_sharded_simulator
+from snapshot import SNAPSHOT_DIR, BRAIN_PATH, read_meta, is_current, load_twin_table, load_pipelines
+
+# Model input columns, in training order (see train_model.py)
+FEATURE_COLS = ['age', 'income_bracket', 'interest_segment', 'past_purchase_count',
+                'campaign_type', 'subject_length', 'send_hour']
+
+# Per-campaign probability vectors kept over all twin profiles
+CAMPAIGN_CACHE_SIZE = 64
+
+# Audiences with fewer twins than this fraction of all profiles are scored
+# on their own unique profiles instead of filling the campaign cache
+PARTIAL_SCORING_RATIO = 0.25
 
 
 class DigitalTwinPredictor:
     """Loads trained ML models and makes predictions for campaign simulations."""
     
-    def __init__(self):
+    def __init__(self, snapshot_dir: Optional[Path] = SNAPSHOT_DIR,
+                 data: Optional[pd.DataFrame] = None, models: Optional[Dict] = None):
+        """
+        Load from a current snapshot, else from the CSV and pickle.
+        
+        Passing data (raw campaign records) and models (fitted pipelines)
+        builds the predictor in memory instead (benchmarks and tests).
+        """
         self.models: Dict = {}
-        self.customer_data: pd.DataFrame = None
-        self._load_models()
-        self._load_customer_data()
+        self.twins: TwinStore = None
+        self.campaign_cache = LRUCache(CAMPAIGN_CACHE_SIZE)
+        self.snapshot_dir: Optional[Path] = None
+        self.version: str = None
+        self.load_seconds = 0.0
+        
+        if data is not None and models is not None:
+            self.models = models
+            self._build_twins(data)
+            self.version = _fingerprint("memory", str(len(data)), str(id(models)))
+            return
+        
+        meta = read_meta(snapshot_dir) if snapshot_dir else None
+        if meta is not None and is_current(meta):
+            self._load_snapshot(snapshot_dir, meta)
+            self.version = _fingerprint(json.dumps(meta, sort_keys=True))
+        else:
+            if meta is not None:
+                print("! Snapshot is older than the CSV or pickle; loading those instead")
+            self._load_models()
+            self._load_customer_data()
+            self.version = _fingerprint(*(
+                f"{path.name}:{path.stat().st_size}:{path.stat().st_mtime_ns}"
+                for path in (BRAIN_PATH, DATA_PATH)
+            ))
+    
+    def _load_snapshot(self, snapshot_dir: Path, meta: dict):
+        """Load the models and memory-mapped twin columns from a snapshot."""
+        self.models = load_pipelines(snapshot_dir)
+        if self.models is None:
+            # Snapshots written before the pipelines were stored with them
+            self._load_models()
+        self.twins = TwinStore.from_table(load_twin_table(snapshot_dir, meta))
+        self.snapshot_dir = Path(snapshot_dir)
+        print(f"✓ Loaded snapshot: {len(self.twins)} twins")
     
     def _load_models(self):
         """Load the trained models from pickle file."""
@@ -29,37 +88,33 @@ class DigitalTwinPredictor:
     def _load_customer_data(self):
         """Load customer data for retrieval and aggregation."""
         if DATA_PATH.exists():
-            self.customer_data = pd.read_csv(DATA_PATH)
-            print(f"✓ Loaded {len(self.customer_data)} customer records")
+            raw = read_raw_data()
+            print(f"✓ Loaded {len(raw)} customer records")
         else:
             raise FileNotFoundError(f"Data file not found at {DATA_PATH}")
+        # The raw rows are dropped once aggregated; registry.reload() builds a new predictor
+        self._build_twins(raw)
+    
+    def _build_twins(self, raw: pd.DataFrame):
+        """Materialize the per-customer twin table from the raw records."""
+        self.twins = TwinStore(raw)
+        budget = self.twins.memory_budget()
+        print(f"✓ Materialized {len(self.twins)} customer twins "
+              f"({budget['bytes_per_twin']:.0f} bytes/twin)")
     
     def get_unique_customers(self) -> pd.DataFrame:
-        """Get unique customers with aggregated engagement history."""
-        # Group by user to get unique customers with their stats
-        agg = self.customer_data.groupby('user_id').agg({
-            'name': 'first',
-            'age': 'first',
-            'income_bracket': 'first',
-            'interest_segment': 'first',
-            'past_purchase_count': 'first',
-            'opened': 'sum',
-            'clicked': 'sum',
-            'converted': 'sum'
-        }).reset_index()
-        
-        agg.columns = ['user_id', 'name', 'age', 'income_bracket', 'interest_segment', 
-                       'past_purchase_count', 'historical_opens', 'historical_clicks',
-                       'historical_conversions']
-        return agg
+        """
+        Get unique customers with aggregated engagement history.
+        
+        The historical_* columns carry the live counters, including ingested
+        events. Other columns share memory with the twin table; callers must
+        not modify them in place.
+        """
+        return self.twins.current_table()
     
     def get_customer_by_id(self, user_id: int) -> dict:
         """Get a single customer's data."""
-        customers = self.get_unique_customers()
-        customer = customers[customers['user_id'] == user_id]
-        if len(customer) == 0:
-            return None
-        return customer.iloc[0].to_dict()
+        return self.twins.get(user_id)
     
     def predict(
         self, 
@@ -73,71 +128,208 @@ class DigitalTwinPredictor:
         
         Returns list of predictions with probabilities.
         """
-        # Get customer data for selected IDs
-        customers = self.get_unique_customers()
-        selected = customers[customers['user_id'].isin(customer_ids)].copy()
+        return self.predict_batch(customer_ids, campaign_type, subject_line, send_hour).to_records()
+    
+    def predict_batch(
+        self,
+        customer_ids: List[int],
+        campaign_type: str,
+        subject_line: str,
+        send_hour: int,
+        seed: int = 42
+    ) -> PredictionBatch:
+        """
+        Run predictions for a campaign and keep the results columnar.
         
-        if len(selected) == 0:
-            return []
+        Outcomes are sampled from the predicted probabilities with a fixed seed,
+        so repeated simulations of the same campaign are reproducible.
+        """
+        return self.predict_variants(customer_ids, [(campaign_type, subject_line, send_hour)], seed)[0]
+    
+    def predict_variants(
+        self,
+        customer_ids: List[int],
+        campaigns: List[Tuple[str, str, int]],
+        seed: int = 42
+    ) -> List[PredictionBatch]:
+        """
+        Run several (campaign_type, subject_line, send_hour) variants against one audience.
         
-        # Prepare features for prediction
-        # Features: age, income_bracket, interest_segment, past_purchase_count, 
-        #           campaign_type, subject_length, send_hour
-        selected['campaign_type'] = campaign_type
-        selected['subject_length'] = len(subject_line)
-        selected['send_hour'] = send_hour
+        The audience is resolved once and all variants are scored in a single
+        model pass per target. Every variant samples with the same seed, so
+        differences between variants are not swamped by sampling noise.
+        """
+        with stage("audience"):
+            positions = self.twins.positions(customer_ids)
+        with stage("twin_columns"):
+            twins = self.twins.columns(positions, PREDICTION_TWIN_COLUMNS)
+        keys = [(campaign_type, len(subject_line), send_hour)
+                for campaign_type, subject_line, send_hour in campaigns]
+        all_probs = self.variant_probs(self.twins.profile_ids[positions], keys)
+        
+        # Open rate ~44%, Click rate ~7%, Unsub rate ~3%, Convert rate ~2%
+        # We use probabilistic sampling - if prob > random threshold, predict True
+        with stage("sample"):
+            return [PredictionBatch(twins, probs, sample_outcomes(probs, seed), positions)
+                    for probs in all_probs]
+    
+    def rollup(self, batch: PredictionBatch) -> Tuple[dict, Dict[str, List[dict]]]:
+        """
+        Expected outcomes versus historical baselines for a batch, overall and
+        by interest segment, income bracket and age bucket.
         
-        feature_cols = ['age', 'income_bracket', 'interest_segment', 'past_purchase_count',
-                        'campaign_type', 'subject_length', 'send_hour']
-        X = selected[feature_cols]
+        Uses the batch's probabilities rather than its sampled outcomes, and
+        the live history counters of the same twins.
+        """
+        with stage("rollup"):
+            positions = batch.positions
+            dims = [(col, self.twins.category_values(col), self.twins.category_codes(col)[positions])
+                    for col in BREAKDOWN_COLUMNS]
+            ages = self.twins.column('age', positions)
+            dims.append(('age_bucket', AGE_BUCKET_LABELS, age_bucket_codes(ages)))
+            history = self.twins.columns(positions, HISTORY_ORDER)
+            return rollup(dims, batch.probs, history)
+    
+    def simulate_aggregate(
+        self,
+        customer_ids: List[int],
+        campaign_type: str,
+        subject_line: str,
+        send_hour: int,
+        seed: int = 42
+    ) -> AggregateResult:
+        """
+        Summary and breakdown counts only, sampled across the shard worker pool.
         
-        # Get predictions from each model
-        predictions = []
+        Draws come from the same per-block RNGs as predict_batch(), so the
+        counts match its summary for a seed no matter how many workers run.
+        """
+        with stage("audience"):
+            positions = self.twins.positions(customer_ids)
+        probs = self.variant_probs(
+            np.arange(len(self.twins.profiles)), [(campaign_type, len(subject_line), send_hour)]
+        )[0]
+        with stage("sharded_sample"):
+            return get_sharded_simulator().simulate(self.twins, positions, probs, seed)
+    
+    def outcome_distribution(
+        self,
+        customer_ids: List[int],
+        campaign_type: str,
+        subject_line: str,
+        send_hour: int,
+        percentiles: List[float],
+        thresholds: Dict[str, List[float]],
+        replicates: int = 0,
+        seed: int = 42
+    ) -> Tuple[int, List[dict]]:
+        """
+        Audience size and the per-target outcome distribution of a campaign.
         
-        # Get probability predictions
-        open_probs = self.models['opened_model'].predict_proba(X)[:, 1]
-        click_probs = self.models['clicked_model'].predict_proba(X)[:, 1]
-        unsub_probs = self.models['unsubscribed_model'].predict_proba(X)[:, 1]
-        conv_probs = self.models['converted_model'].predict_proba(X)[:, 1]
+        Works on unique profiles with their twin counts, so the cost follows
+        the number of distinct profiles rather than twins x replicates.
+        """
+        with stage("audience"):
+            positions = self.twins.positions(customer_ids)
+            profile_ids, counts = np.unique(self.twins.profile_ids[positions], return_counts=True)
+        probs = self.profile_probs(profile_ids, campaign_type, len(subject_line), send_hour)
+        with stage("distribution"):
+            return len(positions), outcome_distribution(
+                probs, counts, percentiles, thresholds, replicates, seed
+            )
+    
+    def profile_probs(
+        self,
+        profile_ids: np.ndarray,
+        campaign_type: str,
+        subject_length: int,
+        send_hour: int
+    ) -> np.ndarray:
+        """Probabilities for twins given by profile ID under one campaign, shaped (targets, twins)."""
+        return self.variant_probs(profile_ids, [(campaign_type, subject_length, send_hour)])[0]
+    
+    def variant_probs(
+        self,
+        profile_ids: np.ndarray,
+        campaigns: List[Tuple[str, int, int]],
+        cache: bool = True
+    ) -> List[np.ndarray]:
+        """
+        Probabilities for twins given by profile ID under each
+        (campaign_type, subject_length, send_hour), shaped (targets, twins).
         
-        # Use realistic thresholds based on actual data distributions
-        # Open rate ~44%, Click rate ~7%, Unsub rate ~3%, Convert rate ~2%
-        # We use probabilistic sampling - if prob > random threshold, predict True
-        np.random.seed(42)  # For reproducibility within session
-        
-        # Use probability as the decision - sample based on predicted probability
-        open_preds = np.array([np.random.random() < p for p in open_probs])
-        click_preds = np.array([np.random.random() < p for p in click_probs])
-        unsub_preds = np.array([np.random.random() < p for p in unsub_probs])
-        conv_preds = np.array([np.random.random() < p for p in conv_probs])
-        
-        # Build response
-        for i, (_, row) in enumerate(selected.iterrows()):
-            predictions.append({
-                'customer_id': int(row['user_id']),
-                'customer_name': row['name'],
-                'age': int(row['age']),
-                'income_bracket': row['income_bracket'],
-                'interest_segment': row['interest_segment'],
-                'will_open': bool(open_preds[i]),
-                'will_click': bool(click_preds[i]),
-                'will_unsubscribe': bool(unsub_preds[i]),
-                'will_convert': bool(conv_preds[i]),
-                'confidence_open': round(float(open_probs[i]), 3),
-                'confidence_click': round(float(click_probs[i]), 3),
-                'confidence_unsub': round(float(unsub_probs[i]), 3),
-                'confidence_convert': round(float(conv_probs[i]), 3)
-            })
-        
-        return predictions
-
+        The models only see profile features plus the campaign, so each unique
+        profile is scored once per campaign, and every uncached campaign goes
+        through one stacked model pass. Large audiences score every profile and
+        cache the result per campaign; small ones score just their own profiles.
+        Pass cache=False for one-off grids that would only evict useful entries.
+        """
+        version = self.twins.version
+        results: List[np.ndarray] = [None] * len(campaigns)
+        missing = []
+        for i, campaign in enumerate(campaigns):
+            cached = self.campaign_cache.get((version,) + tuple(campaign))
+            if cached is not None:
+                results[i] = cached[:, profile_ids]
+            else:
+                missing.append(i)
+        if not missing:
+            return results
+        
+        partial = len(profile_ids) < len(self.twins.profiles) * PARTIAL_SCORING_RATIO
+        if partial:
+            score_ids, inverse = np.unique(profile_ids, return_inverse=True)
+        else:
+            score_ids, inverse = None, profile_ids
+        
+        pending = list(dict.fromkeys(tuple(campaigns[i]) for i in missing))
+        with stage("features"):
+            frames = [self.campaign_features(score_ids, *campaign) for campaign in pending]
+            block = len(frames[0])
+            X = pd.concat(frames, ignore_index=True)
+        stacked = self.predict_proba(X)
+        
+        scored = {}
+        for j, campaign in enumerate(pending):
+            probs = np.ascontiguousarray(stacked[:, j * block:(j + 1) * block])
+            if cache and not partial:
+                self.campaign_cache.put((version,) + campaign, probs)
+            scored[campaign] = probs
+        for i in missing:
+            results[i] = scored[tuple(campaigns[i])][:, inverse]
+        return results
+    
+    def campaign_features(
+        self,
+        profile_ids: np.ndarray,
+        campaign_type: str,
+        subject_length: int,
+        send_hour: int
+    ) -> pd.DataFrame:
+        """Model input frame for the given profiles (all if None) under one campaign."""
+        profiles = self.twins.profiles
+        if profile_ids is not None:
+            profiles = profiles.take(profile_ids)
+        
+        # Features: age, income_bracket, interest_segment, past_purchase_count, 
+        #           campaign_type, subject_length, send_hour
+        X = profiles.reset_index(drop=True)
+        X['campaign_type'] = campaign_type
+        X['subject_length'] = subject_length
+        X['send_hour'] = send_hour
+        return X[FEATURE_COLS]
+    
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """Positive-class probabilities for every target, stacked as (targets, rows)."""
+        probs = np.empty((len(TARGETS), len(X)))
+        if len(X) == 0:
+            return probs
+        for i, target in enumerate(TARGETS):
+            with stage(f"predict_proba.{target}"):
+                probs[i] = self.models[MODEL_KEYS[target]].predict_proba(X)[:, 1]
+        return probs
 
-# Singleton instance
-_predictor = None
 
-def get_predictor() -> DigitalTwinPredictor:
-    """Get or create the singleton predictor instance."""
-    global _predictor
-    if _predictor is None:
-        _predictor = DigitalTwinPredictor()
-    return _predictor
+def _fingerprint(*parts: str) -> str:
+    """Short stable identifier for the sources a predictor was loaded from."""
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
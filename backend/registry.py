@@ -0,0 +1,149 @@
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional
+
+from events import EventStore
+from predictor import DigitalTwinPredictor
+from twin_store import TwinStore
+
+# Twins in the canary simulation run before a new version goes live
+CANARY_SIZE = 1000
+
+# Versions kept in the reload history
+HISTORY_SIZE = 20
+
+
+class PredictorRegistry:
+    """
+    Holds the live predictor and swaps in new versions without downtime.
+
+    A reload builds the next predictor on a background thread, warms it with
+    a canary simulation, and then replaces the live reference in one
+    assignment. Requests hold on to the predictor they started with, so
+    in-flight work finishes on the old version.
+    """
+
+    def __init__(self, factory: Callable[[], DigitalTwinPredictor] = DigitalTwinPredictor,
+                 events: Optional[EventStore] = None):
+        self.factory = factory
+        self.events = events
+        self._current: Optional[DigitalTwinPredictor] = None
+        self._lock = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+        self.history: List[dict] = []
+
+    def get(self) -> DigitalTwinPredictor:
+        """The live predictor, loading the first version on demand."""
+        current = self._current
+        if current is None:
+            # Handlers run on worker threads; only one of them should load
+            with self._lock:
+                if self._current is None:
+                    self._swap_in(self._build())
+                current = self._current
+        return current
+
+    @property
+    def current(self) -> Optional[DigitalTwinPredictor]:
+        """The live predictor without loading one; None before the first load."""
+        return self._current
+
+    def twins(self) -> TwinStore:
+        """Twin store of the live predictor."""
+        return self.get().twins
+
+    @property
+    def loading(self) -> bool:
+        return self._loading is not None and self._loading.is_alive()
+
+    def reload(self, wait: bool = False) -> bool:
+        """
+        Build, warm and swap in a new version from the current sources.
+
+        Returns False if a reload is already running. With wait=True, blocks
+        until the swap (or failure) instead of running in the background.
+        """
+        with self._lock:
+            if self.loading:
+                return False
+            self._loading = threading.Thread(target=self._reload, name="predictor-reload", daemon=True)
+            self._loading.start()
+            thread = self._loading
+        if wait:
+            thread.join()
+        return True
+
+    def install(self, predictor: DigitalTwinPredictor):
+        """Make an already built predictor live (benchmarks and tests)."""
+        with self._lock:
+            self._activate(predictor)
+
+    def _reload(self):
+        try:
+            predictor = self._build()
+        except Exception:
+            self.last_error = traceback.format_exc(limit=3)
+            print(f"! Reload failed, keeping version {self.version}:\n{self.last_error}")
+            return
+        with self._lock:
+            self._swap_in(predictor)
+
+    def _swap_in(self, predictor: DigitalTwinPredictor):
+        """Catch the new twins up on logged events and make them live; callers hold the lock."""
+        if self.events is None:
+            self._activate(predictor)
+            return
+        # Holding the event lock means no event lands between replay and swap
+        with self.events.lock:
+            self.events.replay_into(predictor.twins)
+            self._activate(predictor)
+
+    def _build(self) -> DigitalTwinPredictor:
+        """Load a predictor and warm it; raises if the canary misbehaves."""
+        started = time.perf_counter()
+        predictor = self.factory()
+        canary_ids = predictor.twins.user_ids[:CANARY_SIZE].tolist()
+        batch = predictor.predict_batch(canary_ids, 'Promo', 'Canary: your weekly picks', 10)
+        if len(batch) != len(canary_ids) or not ((batch.probs >= 0) & (batch.probs <= 1)).all():
+            raise ValueError(f"canary simulation failed for version {predictor.version}")
+        predictor.load_seconds = time.perf_counter() - started
+        return predictor
+
+    def _activate(self, predictor: DigitalTwinPredictor):
+        """Swap the live reference; callers hold the lock."""
+        self._current = predictor
+        self.last_error = None
+        self.history.append({
+            'version': predictor.version,
+            'activated_at': time.time(),
+            'load_seconds': round(predictor.load_seconds, 3),
+            'twins': len(predictor.twins)
+        })
+        del self.history[:-HISTORY_SIZE]
+        print(f"✓ Serving version {predictor.version}")
+
+    @property
+    def version(self) -> Optional[str]:
+        current = self._current
+        return current.version if current is not None else None
+
+    def status(self) -> dict:
+        current = self._current
+        return {
+            'version': self.version,
+            'loading': self.loading,
+            'last_error': self.last_error,
+            'memory': current.twins.memory_budget() if current is not None else None,
+            'history': list(self.history)
+        }
+
+
+event_store = EventStore()
+registry = PredictorRegistry(events=event_store)
+
+
+def get_predictor() -> DigitalTwinPredictor:
+    """Get the live predictor version."""
+    return registry.get()
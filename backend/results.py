@@ -0,0 +1,381 @@
+import math
+import numpy as np
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+
+# Prediction targets, in the order probabilities and outcomes are stacked
+TARGETS = ['open', 'click', 'unsub', 'convert']
+
+# Trained model for each target in ecommerce_brain.pkl
+MODEL_KEYS = {
+    'open': 'opened_model',
+    'click': 'clicked_model',
+    'unsub': 'unsubscribed_model',
+    'convert': 'converted_model'
+}
+
+# Twin columns carried through to per-customer predictions
+PREDICTION_TWIN_COLUMNS = ['user_id', 'name', 'age', 'income_bracket', 'interest_segment']
+
+# Twins per outcome-sampling RNG block; sampled outcomes depend on this and the seed
+SAMPLE_BLOCK_SIZE = 65536
+
+# Columns rolled up for breakdown responses
+BREAKDOWN_COLUMNS = ['interest_segment', 'income_bracket']
+
+# Age bucket upper bounds (exclusive) for rollups, and the bucket labels
+AGE_BUCKET_EDGES = [25, 35, 45, 55, 65]
+AGE_BUCKET_LABELS = ['<25', '25-34', '35-44', '45-54', '55-64', '65+']
+
+# Field stems per target in rollup rows: (count, rate)
+ROLLUP_FIELDS = {
+    'open': ('opens', 'open'),
+    'click': ('clicks', 'click'),
+    'unsub': ('unsubscribes', 'unsubscribe'),
+    'convert': ('conversions', 'conversion')
+}
+
+# Historical counter giving each target's per-send baseline; unsubscribes aren't tracked
+BASELINE_COUNTERS = {
+    'open': 'historical_opens',
+    'click': 'historical_clicks',
+    'convert': 'historical_conversions'
+}
+
+# Counter rows stacked under the probabilities in rollup()
+HISTORY_ORDER = ['historical_sends'] + list(BASELINE_COUNTERS.values())
+
+
+def sample_outcomes(probs: np.ndarray, seed: int = 42, first_block: int = 0,
+                    block_size: int = SAMPLE_BLOCK_SIZE) -> np.ndarray:
+    """
+    Draw one Bernoulli outcome per probability, SAMPLE_BLOCK_SIZE twins at a time.
+
+    Block b of an audience (in position order) draws from its own RNG seeded
+    with (seed, b), so a worker sampling only some blocks (see sharding.py)
+    reproduces exactly the outcomes of sampling the whole audience at once.
+    """
+    outcomes = np.empty(probs.shape, dtype=bool)
+    for start in range(0, probs.shape[1], block_size):
+        block = probs[:, start:start + block_size]
+        rng = np.random.default_rng([seed, first_block + start // block_size])
+        outcomes[:, start:start + block_size] = rng.random(block.shape) < block
+    return outcomes
+
+
+class PredictionBatch:
+    """Columnar simulation output: twins along one axis, targets along the other."""
+
+    def __init__(self, twins: Dict[str, np.ndarray], probs: np.ndarray, outcomes: np.ndarray,
+                 positions: Optional[np.ndarray] = None):
+        self.twins = twins
+        self.probs = probs          # (len(TARGETS), n) float
+        self.outcomes = outcomes    # (len(TARGETS), n) bool
+        self.positions = positions  # twin store rows, when the batch came from one
+
+    def __len__(self) -> int:
+        return self.probs.shape[1]
+
+    def counts(self) -> np.ndarray:
+        """Sampled positive outcomes per target."""
+        return self.outcomes.sum(axis=1)
+
+    def summary(self) -> dict:
+        """Aggregate metrics in the SimulationSummary shape."""
+        return summarize(len(self), self.counts())
+
+    def breakdown(self, column: str) -> List[dict]:
+        """Summaries per distinct value of a twin column, from one bincount per target."""
+        values, groups = np.unique(self.twins[column], return_inverse=True)
+        totals = np.bincount(groups, minlength=len(values))
+        counts = np.stack([
+            np.bincount(groups, weights=self.outcomes[i], minlength=len(values))
+            for i in range(len(TARGETS))
+        ])
+        return [
+            dict(summarize(totals[g], counts[:, g]), value=str(values[g]))
+            for g in range(len(values))
+        ]
+
+    def sample_index(self, size: int, seed: int = 42) -> np.ndarray:
+        """Sorted positions of a reproducible random sample of at most size rows."""
+        if size >= len(self):
+            return np.arange(len(self))
+        rng = np.random.RandomState(seed)
+        return np.sort(rng.choice(len(self), size=size, replace=False))
+
+    def top_index(self, size: int, target: str) -> np.ndarray:
+        """Positions of the size most confident rows for a target, most confident first."""
+        probs = self.probs[TARGETS.index(target)]
+        if size < len(self):
+            top = np.argpartition(-probs, size - 1)[:size]
+        else:
+            top = np.arange(len(self))
+        return top[np.argsort(-probs[top], kind='stable')]
+
+    def to_records(self, index: Optional[np.ndarray] = None) -> List[dict]:
+        """Per-customer predictions as plain dicts, optionally for a subset of rows."""
+        if index is None:
+            index = slice(None)
+        probs = np.round(self.probs[:, index], 3)
+        outcomes = self.outcomes[:, index]
+        columns = {
+            'customer_id': self.twins['user_id'][index].tolist(),
+            'customer_name': self.twins['name'][index].tolist(),
+            'age': self.twins['age'][index].tolist(),
+            'income_bracket': self.twins['income_bracket'][index].tolist(),
+            'interest_segment': self.twins['interest_segment'][index].tolist(),
+            'will_open': outcomes[0].tolist(),
+            'will_click': outcomes[1].tolist(),
+            'will_unsubscribe': outcomes[2].tolist(),
+            'will_convert': outcomes[3].tolist(),
+            'confidence_open': probs[0].tolist(),
+            'confidence_click': probs[1].tolist(),
+            'confidence_unsub': probs[2].tolist(),
+            'confidence_convert': probs[3].tolist()
+        }
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+class AggregateResult:
+    """Merged counts from a simulation that never materialized per-twin rows."""
+
+    def __init__(self, total: int, counts: np.ndarray, groups: Dict[str, tuple]):
+        self.total = total
+        self._counts = counts
+        # column -> (values, twins per value, (targets, values) positive counts)
+        self.groups = groups
+
+    def __len__(self) -> int:
+        return self.total
+
+    def counts(self) -> np.ndarray:
+        return self._counts
+
+    def summary(self) -> dict:
+        return summarize(self.total, self._counts)
+
+    def breakdown(self, column: str) -> List[dict]:
+        """Summaries per value present, sorted by value like PredictionBatch.breakdown()."""
+        values, totals, counts = self.groups[column]
+        return [
+            dict(summarize(totals[g], counts[:, g]), value=str(values[g]))
+            for g in sorted(range(len(values)), key=lambda g: str(values[g])) if totals[g] > 0
+        ]
+
+
+def age_bucket_codes(ages: np.ndarray) -> np.ndarray:
+    """Index into AGE_BUCKET_LABELS for each age."""
+    return np.searchsorted(AGE_BUCKET_EDGES, ages, side='right')
+
+
+def rollup(
+    dims: List[Tuple[str, List[str], np.ndarray]],
+    probs: np.ndarray,
+    history: Dict[str, np.ndarray]
+) -> Tuple[dict, Dict[str, List[dict]]]:
+    """
+    Expected outcomes and historical baselines, overall and per value of each dimension.
+    
+    dims holds (name, labels, code per twin) with -1 for unknown values.
+    Every twin is binned into one cell of the dimensions' cross product, the
+    probabilities and history counters are summed per cell with one
+    bincount each, and each dimension's rollup is a marginal of that grid.
+    """
+    weights = np.vstack([probs] + [history[col] for col in HISTORY_ORDER])
+    overall = _rollup_row('all', probs.shape[1], weights.sum(axis=1))
+    
+    sizes = tuple(len(labels) for _, labels, _ in dims)
+    known = np.logical_and.reduce([codes >= 0 for _, _, codes in dims])
+    cells = np.ravel_multi_index([codes[known] for _, _, codes in dims], sizes)
+    n_cells = int(np.prod(sizes))
+    totals = np.bincount(cells, minlength=n_cells).reshape(sizes)
+    sums = np.stack([
+        np.bincount(cells, weights=w[known], minlength=n_cells) for w in weights
+    ]).reshape((len(weights),) + sizes)
+    
+    groups = {}
+    for axis, (name, labels, _) in enumerate(dims):
+        others = tuple(a for a in range(len(dims)) if a != axis)
+        group_totals = totals.sum(axis=others)
+        group_sums = sums.sum(axis=tuple(a + 1 for a in others))
+        groups[name] = [_rollup_row(labels[g], group_totals[g], group_sums[:, g])
+                        for g in range(len(labels)) if group_totals[g] > 0]
+    return overall, groups
+
+
+def _rollup_row(value: str, total: int, sums: np.ndarray) -> dict:
+    """Rollup fields from summed (targets + HISTORY_ORDER) weights."""
+    total = int(total)
+    history = dict(zip(HISTORY_ORDER, sums[len(TARGETS):]))
+    sends = int(history['historical_sends'])
+    row = {'value': str(value), 'total_customers': total, 'historical_sends': sends}
+    for i, target in enumerate(TARGETS):
+        count_name, rate_name = ROLLUP_FIELDS[target]
+        expected = float(sums[i])
+        rate = expected / total if total else 0.0
+        row[f'expected_{count_name}'] = round(expected, 2)
+        row[f'{rate_name}_rate'] = round(rate, 4)
+        if target not in BASELINE_COUNTERS:
+            continue
+        baseline = float(history[BASELINE_COUNTERS[target]]) / sends if sends else None
+        row[f'baseline_{rate_name}_rate'] = round(baseline, 4) if baseline is not None else None
+        row[f'{rate_name}_uplift'] = round(rate - baseline, 4) if baseline is not None else None
+        row[f'{rate_name}_lift'] = round(rate / baseline - 1, 4) if baseline else None
+    return row
+
+
+def summarize(total: int, counts: np.ndarray) -> dict:
+    """Build SimulationSummary fields from a twin count and per-target positives."""
+    opens, clicks, unsubs, conversions = (int(c) for c in counts)
+    return {
+        'total_customers': int(total),
+        'predicted_opens': opens,
+        'predicted_clicks': clicks,
+        'predicted_unsubscribes': unsubs,
+        'predicted_conversions': conversions,
+        'open_rate': round(opens / total, 4) if total > 0 else 0,
+        'click_rate': round(clicks / total, 4) if total > 0 else 0,
+        'unsubscribe_rate': round(unsubs / total, 4) if total > 0 else 0,
+        'conversion_rate': round(conversions / total, 4) if total > 0 else 0
+    }
+
+
+# Summary fields compared between variants, with their count fields
+COMPARED_METRICS = {
+    'open_rate': 'predicted_opens',
+    'click_rate': 'predicted_clicks',
+    'unsubscribe_rate': 'predicted_unsubscribes',
+    'conversion_rate': 'predicted_conversions'
+}
+
+
+def compare_variants(summaries: List[dict], alpha: float = 0.05) -> List[dict]:
+    """
+    Pairwise lift and two-proportion z-test for every pair of variant summaries.
+    
+    Lift is relative to the earlier variant in each pair.
+    """
+    comparisons = []
+    for a in range(len(summaries)):
+        for b in range(a + 1, len(summaries)):
+            for metric, count_field in COMPARED_METRICS.items():
+                z, p_value = two_proportion_test(
+                    summaries[a][count_field], summaries[a]['total_customers'],
+                    summaries[b][count_field], summaries[b]['total_customers']
+                )
+                rate_a, rate_b = summaries[a][metric], summaries[b][metric]
+                comparisons.append({
+                    'variant_a': a,
+                    'variant_b': b,
+                    'metric': metric,
+                    'lift': round((rate_b - rate_a) / rate_a, 4) if rate_a > 0 else None,
+                    'z_score': round(z, 4),
+                    'p_value': round(p_value, 6),
+                    'significant': p_value < alpha
+                })
+    return comparisons
+
+
+def two_proportion_test(x_a: int, n_a: int, x_b: int, n_b: int) -> Tuple[float, float]:
+    """Pooled two-proportion z statistic and two-sided p-value."""
+    if n_a == 0 or n_b == 0:
+        return 0.0, 1.0
+    pooled = (x_a + x_b) / (n_a + n_b)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / n_a + 1 / n_b))
+    if se == 0:
+        return 0.0, 1.0
+    z = (x_b / n_b - x_a / n_a) / se
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+
+# Binomial draws per replicate chunk, bounding memory for the replicates method
+REPLICATE_CHUNK_DRAWS = 4_000_000
+
+# Most binomial draws (replicates x profiles x targets) one replicates request
+# may cost; more would outlast the simulation pool's timeout
+MAX_REPLICATE_DRAWS = 100_000_000
+
+_normal = NormalDist()
+
+
+def outcome_distribution(
+    probs: np.ndarray,
+    counts: np.ndarray,
+    percentiles: List[float],
+    thresholds: Dict[str, List[float]],
+    replicates: int = 0,
+    seed: int = 42
+) -> List[dict]:
+    """
+    Distribution of each target's positive count over repeated simulations.
+    
+    probs is (targets, profiles) and counts the twins sharing each profile,
+    so a target's total is a sum of Binomial(count, p) per profile, the
+    Poisson-binomial over the audience. Mean and spread are exact. With
+    replicates=0, percentiles and tail risks come from a skew-corrected
+    normal approximation (Cornish-Fisher / Edgeworth); otherwise they come
+    from that many replicate totals drawn profile by profile.
+    """
+    total = int(counts.sum())
+    rng = np.random.default_rng(seed)
+    results = []
+    for i, target in enumerate(TARGETS):
+        p = probs[i]
+        mean = float(counts @ p)
+        var = float(counts @ (p * (1 - p)))
+        sd = math.sqrt(var)
+        skew = float(counts @ (p * (1 - p) * (1 - 2 * p))) / var ** 1.5 if var > 0 else 0.0
+        
+        if replicates:
+            draws = _replicate_totals(rng, counts, p, replicates)
+            quantiles = np.percentile(draws, percentiles)
+            tails = {x: float((draws > x * total).mean()) for x in thresholds.get(target, [])}
+        else:
+            quantiles = [_cornish_fisher(mean, sd, skew, q / 100, total) for q in percentiles]
+            tails = {x: _edgeworth_tail(mean, sd, skew, x * total) for x in thresholds.get(target, [])}
+        
+        results.append({
+            'target': target,
+            'expected_count': round(mean, 2),
+            'expected_rate': round(mean / total, 6) if total else 0,
+            'std_rate': round(sd / total, 6) if total else 0,
+            'intervals': [
+                {'percentile': q, 'count': round(float(c), 2),
+                 'rate': round(float(c) / total, 6) if total else 0}
+                for q, c in zip(percentiles, quantiles)
+            ],
+            'tail_risks': [
+                {'threshold': x, 'probability': round(prob, 6)} for x, prob in tails.items()
+            ]
+        })
+    return results
+
+
+def _replicate_totals(rng: np.random.Generator, counts: np.ndarray, p: np.ndarray,
+                      replicates: int) -> np.ndarray:
+    """Totals of replicates independent draws, as (replicates,) counts."""
+    chunk = max(1, REPLICATE_CHUNK_DRAWS // max(len(counts), 1))
+    totals = np.empty(replicates, dtype=np.int64)
+    for start in range(0, replicates, chunk):
+        n = min(chunk, replicates - start)
+        totals[start:start + n] = rng.binomial(counts, p, size=(n, len(counts))).sum(axis=1)
+    return totals
+
+
+def _cornish_fisher(mean: float, sd: float, skew: float, q: float, total: int) -> float:
+    """Approximate q-quantile of a count from its first three moments."""
+    if sd == 0:
+        return mean
+    z = _normal.inv_cdf(min(max(q, 1e-12), 1 - 1e-12))
+    return min(max(mean + sd * (z + skew * (z * z - 1) / 6), 0.0), float(total))
+
+
+def _edgeworth_tail(mean: float, sd: float, skew: float, bound: float) -> float:
+    """Approximate P(count > bound) with a continuity and skewness correction."""
+    if sd == 0:
+        return 1.0 if mean > bound else 0.0
+    z = (math.floor(bound) + 0.5 - mean) / sd
+    cdf = _normal.cdf(z) - skew / 6 * (z * z - 1) * _normal.pdf(z)
+    return min(max(1.0 - cdf, 0.0), 1.0)
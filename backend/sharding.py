@@ -0,0 +1,186 @@
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from results import AggregateResult, BREAKDOWN_COLUMNS, SAMPLE_BLOCK_SIZE, sample_outcomes
+
+# Worker processes for sharded simulation; 0 runs the shards in-process
+SHARD_WORKERS = int(os.environ.get("TWIN_SHARD_WORKERS", str(os.cpu_count() or 1)))
+
+# Audiences at least this large are simulated on the sharded path
+SHARD_MIN_TWINS = int(os.environ.get("TWIN_SHARD_MIN_TWINS", "1000000"))
+
+# Twins per block of work; matches the sampling RNG blocks, so results depend
+# only on the seed, never on worker count, and equal unsharded sampling
+SHARD_BLOCK_SIZE = SAMPLE_BLOCK_SIZE
+
+# Twin store versions kept published, so calls still on an older store finish
+PUBLISHED_VERSIONS = 2
+
+
+class ShardedSimulator:
+    """
+    Aggregate-only simulation spread over a process pool.
+
+    Twin arrays are published once per twin store version as .npy files that
+    workers memory-map, so the OS shares the pages instead of each call
+    pickling the table. The audience is cut into the same blocks that
+    results.sample_outcomes() draws with, each from its own RNG derived from
+    (seed, block index), so the counts equal those of an unsharded run;
+    workers take contiguous runs of blocks and return partial counts that are summed.
+    """
+
+    def __init__(self, workers: int = SHARD_WORKERS, block_size: int = SHARD_BLOCK_SIZE):
+        self.workers = workers
+        self.block_size = block_size
+        self._dir = Path(tempfile.mkdtemp(prefix="twin-shards-"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._published: Dict[int, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _publish(self, twins) -> Dict[str, str]:
+        """Write the twin arrays workers need for this store version, once."""
+        with self._lock:
+            paths = self._published.get(twins.version)
+            if paths is not None:
+                return paths
+            folder = self._dir / f"v{twins.version}-{uuid.uuid4().hex[:8]}"
+            folder.mkdir()
+            arrays = {'profile_ids': twins.profile_ids}
+            arrays.update({col: twins.category_codes(col) for col in BREAKDOWN_COLUMNS})
+            paths = {}
+            for name, array in arrays.items():
+                paths[name] = str(folder / f"{name}.npy")
+                np.save(paths[name], np.ascontiguousarray(array))
+            self._published[twins.version] = paths
+            for old in sorted(self._published)[:-PUBLISHED_VERSIONS]:
+                shutil.rmtree(Path(self._published.pop(old)['profile_ids']).parent, ignore_errors=True)
+            return paths
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def simulate(self, twins, positions: np.ndarray, profile_probs: np.ndarray,
+                 seed: int = 42) -> AggregateResult:
+        """
+        Sample outcomes for the twins at positions and merge the counts.
+
+        profile_probs holds probabilities for every profile, shaped (targets, profiles).
+        """
+        paths = dict(self._publish(twins))
+        paths['positions'] = str(self._dir / f"audience-{uuid.uuid4().hex}.npy")
+        np.save(paths['positions'], positions)
+
+        n_blocks = math.ceil(len(positions) / self.block_size)
+        runs = [r for r in np.array_split(np.arange(n_blocks), max(self.workers, 1)) if len(r)]
+        n_groups = {col: len(twins.category_values(col)) for col in BREAKDOWN_COLUMNS}
+        tasks = [(paths, profile_probs, int(r[0]), int(r[-1]) + 1, self.block_size, seed, n_groups)
+                 for r in runs]
+        try:
+            if self.workers > 0:
+                executor = self._executor()
+                partials = list(executor.map(_simulate_blocks, *zip(*tasks)))
+            else:
+                partials = [_simulate_blocks(*task) for task in tasks]
+        finally:
+            os.remove(paths['positions'])
+
+        counts = np.zeros(profile_probs.shape[0], dtype=np.int64)
+        groups = {col: (twins.category_values(col), np.zeros(n, dtype=np.int64),
+                        np.zeros((profile_probs.shape[0], n), dtype=np.int64))
+                  for col, n in n_groups.items()}
+        for part_counts, part_groups in partials:
+            counts += part_counts
+            for col, (totals, group_counts) in part_groups.items():
+                groups[col][1][:] += totals
+                groups[col][2][:] += group_counts
+        return AggregateResult(len(positions), counts, groups)
+
+    def shutdown(self):
+        """Stop worker processes and remove published arrays."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+# Memory-mapped arrays opened by this worker process, by path
+_mapped: Dict[str, np.ndarray] = {}
+
+
+def _open(path: str) -> np.ndarray:
+    array = _mapped.get(path)
+    if array is None:
+        # A new path means a new store version; drop maps of unpublished ones so
+        # their deleted files' pages are released
+        for stale in [p for p in _mapped if not os.path.exists(p)]:
+            del _mapped[stale]
+        array = _mapped[path] = np.load(path, mmap_mode="r")
+    return array
+
+
+def _simulate_blocks(paths: Dict[str, str], profile_probs: np.ndarray, first_block: int,
+                     end_block: int, block_size: int, seed: int,
+                     n_groups: Dict[str, int]) -> Tuple[np.ndarray, Dict[str, tuple]]:
+    """Sample a contiguous run of audience blocks and return partial counts."""
+    # The audience file is per call; don't keep it mapped after it's deleted
+    positions = np.load(paths['positions'], mmap_mode="r")
+    profile_ids = _open(paths['profile_ids'])
+    n_targets = profile_probs.shape[0]
+
+    counts = np.zeros(n_targets, dtype=np.int64)
+    groups = {col: (np.zeros(n, dtype=np.int64), np.zeros((n_targets, n), dtype=np.int64))
+              for col, n in n_groups.items()}
+    for block in range(first_block, end_block):
+        pos = np.asarray(positions[block * block_size:(block + 1) * block_size])
+        probs = profile_probs[:, profile_ids[pos]]
+        outcomes = sample_outcomes(probs, seed, first_block=block, block_size=block_size)
+        counts += outcomes.sum(axis=1)
+        for col, (totals, group_counts) in groups.items():
+            codes = np.asarray(_open(paths[col])[pos])
+            known = codes >= 0
+            codes = codes[known]
+            n = n_groups[col]
+            totals += np.bincount(codes, minlength=n)
+            for t in range(n_targets):
+                group_counts[t] += np.bincount(codes, weights=outcomes[t][known],
+                                               minlength=n).astype(np.int64)
+    del positions
+    return counts, groups
+
+
+_simulator: Optional[ShardedSimulator] = None
+_simulator_lock = threading.Lock()
+
+
+def get_sharded_simulator() -> ShardedSimulator:
+    """Shared sharded simulator, created on first use (not in worker processes)."""
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = ShardedSimulator()
+    return _simulator
+
+
+def shutdown_sharded_simulator():
+    """Stop the shared simulator's workers, if it was ever started."""
+    global _simulator
+    with _simulator_lock:
+        if _simulator is not None:
+            _simulator.shutdown()
+            _simulator = None
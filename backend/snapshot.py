@@ -0,0 +1,143 @@
+"""
+Binary snapshot of the twin table and models for fast startup.
+
+Loading the CSV means parsing and aggregating every campaign row on every
+cold start in every worker. A snapshot stores each twin column as a raw
+.npy file (categoricals as integer codes) next to the fitted sklearn
+pipelines, so the server memory-maps columns and the OS shares the pages
+between workers.
+
+Usage:
+    python snapshot.py            # build ../twin_snapshot from the CSV and pickle
+    python snapshot.py OUT_DIR    # build into another directory
+"""
+import json
+import os
+import shutil
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+
+from twin_store import build_twin_table, read_raw_data, TWIN_COLUMNS, DATA_PATH
+
+# Fitted pipelines written by train_model.py
+BRAIN_PATH = Path(__file__).parent.parent / "ecommerce_brain.pkl"
+
+SNAPSHOT_DIR = Path(os.environ.get("TWIN_SNAPSHOT_DIR", Path(__file__).parent.parent / "twin_snapshot"))
+
+SNAPSHOT_FORMAT = 2
+
+# Stored as integer codes plus a category list in meta.json
+CATEGORY_COLUMNS = ['name', 'income_bracket', 'interest_segment']
+
+# Fitted sklearn pipelines, as in ecommerce_brain.pkl
+PIPELINES_FILE = "pipelines.joblib"
+
+
+def build_snapshot(out_dir: Path = SNAPSHOT_DIR):
+    """Aggregate the CSV and write it with the models to a snapshot directory."""
+    started = time.perf_counter()
+    raw = read_raw_data()
+    table = build_twin_table(raw)
+    del raw
+    models = joblib.load(BRAIN_PATH)
+
+    # Write next to the target and swap in, so readers never see a partial snapshot
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    columns = {}
+    for col in TWIN_COLUMNS:
+        if col in CATEGORY_COLUMNS:
+            codes, categories = pd.factorize(table[col], sort=True)
+            np.save(tmp_dir / f"{col}.npy", codes.astype(_code_dtype(len(categories))))
+            columns[col] = {'kind': 'category', 'categories': [str(c) for c in categories]}
+        else:
+            np.save(tmp_dir / f"{col}.npy", table[col].to_numpy())
+            columns[col] = {'kind': 'numeric'}
+    joblib.dump(models, tmp_dir / PIPELINES_FILE)
+
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'created_at': time.time(),
+        'n_twins': len(table),
+        'sources': {
+            'data_mtime': DATA_PATH.stat().st_mtime,
+            'model_mtime': BRAIN_PATH.stat().st_mtime
+        },
+        'columns': columns
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta))
+
+    old_dir = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        out_dir.rename(old_dir)
+    tmp_dir.rename(out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"✓ Snapshot of {len(table)} twins written to {out_dir} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+def _code_dtype(n_categories: int) -> np.dtype:
+    """Narrowest signed integer dtype that holds codes for n categories (and -1)."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def read_meta(snapshot_dir: Path = SNAPSHOT_DIR) -> Optional[dict]:
+    """Snapshot metadata, or None if there is no usable snapshot."""
+    path = Path(snapshot_dir) / "meta.json"
+    if not path.exists():
+        return None
+    meta = json.loads(path.read_text())
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return meta
+
+
+def is_current(meta: dict) -> bool:
+    """Whether the snapshot is at least as new as the CSV and pickle it came from."""
+    sources = meta['sources']
+    for path, key in ((DATA_PATH, 'data_mtime'), (BRAIN_PATH, 'model_mtime')):
+        if path.exists() and path.stat().st_mtime > sources[key]:
+            return False
+    return True
+
+
+def load_twin_table(snapshot_dir: Path = SNAPSHOT_DIR, meta: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Twin table backed by memory-mapped column files.
+
+    Categorical columns become pandas categoricals over their stored codes;
+    pages are read from disk only when a column slice is touched.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    meta = meta or read_meta(snapshot_dir)
+    data = {}
+    for col, spec in meta['columns'].items():
+        values = np.load(snapshot_dir / f"{col}.npy", mmap_mode='r')
+        if spec['kind'] == 'category':
+            data[col] = pd.Categorical.from_codes(values, categories=spec['categories'])
+        else:
+            data[col] = values
+    return pd.DataFrame(data, columns=TWIN_COLUMNS, copy=False)
+
+
+def load_pipelines(snapshot_dir: Path = SNAPSHOT_DIR) -> Optional[dict]:
+    """Fitted sklearn pipelines stored with the snapshot, or None for older snapshots."""
+    path = Path(snapshot_dir) / PIPELINES_FILE
+    return joblib.load(path) if path.exists() else None
+
+
+if __name__ == "__main__":
+    build_snapshot(Path(sys.argv[1]) if len(sys.argv) > 1 else SNAPSHOT_DIR)
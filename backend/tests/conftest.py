@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Backend modules import each other by plain name; the generator and trainer live one level up
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BACKEND_DIR.parent))
@@ -0,0 +1,67 @@
+"""Sharded aggregates against the unsharded sampling path."""
+import os
+import numpy as np
+import pytest
+
+from dummy import make_campaign_pool, simulate_chunk
+from twin_store import TwinStore
+from results import (
+    PredictionBatch, BREAKDOWN_COLUMNS, PREDICTION_TWIN_COLUMNS, TARGETS, sample_outcomes
+)
+import sharding
+
+# Small blocks, so a few thousand twins span many blocks and every worker gets some
+BLOCK_SIZE = 256
+
+
+@pytest.fixture(scope="module")
+def twins():
+    rng = np.random.default_rng(11)
+    return TwinStore(simulate_chunk(rng, 1001, 5000, 2, make_campaign_pool(rng)))
+
+
+@pytest.fixture(scope="module")
+def audience(twins):
+    rng = np.random.default_rng(3)
+    positions = np.sort(rng.choice(len(twins), 4000, replace=False))
+    profile_probs = rng.random((len(TARGETS), len(twins.profiles)))
+    return positions, profile_probs
+
+
+def unsharded(twins, positions, profile_probs, seed):
+    probs = profile_probs[:, twins.profile_ids[positions]]
+    outcomes = sample_outcomes(probs, seed, block_size=BLOCK_SIZE)
+    return PredictionBatch(twins.columns(positions, PREDICTION_TWIN_COLUMNS), probs, outcomes, positions)
+
+
+@pytest.mark.parametrize("workers", [0, 1, 3])
+def test_sharded_counts_match_unsharded(twins, audience, workers):
+    positions, profile_probs = audience
+    expected = unsharded(twins, positions, profile_probs, seed=5)
+
+    simulator = sharding.ShardedSimulator(workers=workers, block_size=BLOCK_SIZE)
+    try:
+        result = simulator.simulate(twins, positions, profile_probs, seed=5)
+    finally:
+        simulator.shutdown()
+
+    assert result.summary() == expected.summary()
+    for col in BREAKDOWN_COLUMNS:
+        assert result.breakdown(col) == expected.breakdown(col)
+
+
+def test_unpublished_versions_are_unmapped(audience):
+    positions, _ = audience
+    rng = np.random.default_rng(5)
+    pool = make_campaign_pool(rng)
+    simulator = sharding.ShardedSimulator(workers=0, block_size=BLOCK_SIZE)
+    try:
+        # Each store is a new version; older ones are unpublished past PUBLISHED_VERSIONS
+        for _ in range(sharding.PUBLISHED_VERSIONS + 2):
+            store = TwinStore(simulate_chunk(rng, 1001, 5000, 1, pool))
+            simulator.simulate(store, positions, np.full((len(TARGETS), len(store.profiles)), 0.5))
+        assert sharding._mapped
+        assert all(os.path.exists(path) for path in sharding._mapped)
+    finally:
+        simulator.shutdown()
+        sharding._mapped.clear()
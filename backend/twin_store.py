@@ -0,0 +1,406 @@
+import itertools
+import threading
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cache import LRUCache
+from models import IncomeLevel, InterestSegment
+
+
+# Columns of the materialized twin table, in response order
+TWIN_COLUMNS = ['user_id', 'name', 'age', 'income_bracket', 'interest_segment',
+                'past_purchase_count', 'historical_opens', 'historical_clicks',
+                'historical_conversions', 'historical_sends']
+
+# Engagement counters kept in writable arrays and updated by event ingestion,
+# in EVENT_KINDS order (see events.py)
+COUNTER_COLUMNS = ['historical_sends', 'historical_opens', 'historical_clicks',
+                   'historical_conversions']
+
+# Columns with a categorical (posting list) index
+INDEXED_CATEGORIES = ['interest_segment', 'income_bracket']
+
+# Filtered result sets kept for cheap pagination, bounded by count and by bytes
+RESULT_CACHE_SIZE = 128
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Store versions are unique across TwinStore instances in a process
+_versions = itertools.count(1)
+
+# Twin columns the models see; twins sharing these values share a profile
+PROFILE_COLUMNS = ['age', 'income_bracket', 'interest_segment', 'past_purchase_count']
+
+# Campaign records the twin table is built from
+DATA_PATH = Path(__file__).parent.parent / "ecommerce_marketing_data.csv"
+
+# Raw CSV columns the twin table is built from, with compact dtypes to parse them into
+RAW_DTYPES = {
+    'user_id': 'int64',
+    'name': 'category',
+    'age': 'int16',
+    'income_bracket': 'category',
+    'interest_segment': 'category',
+    'past_purchase_count': 'int16',
+    'opened': 'int8',
+    'clicked': 'int8',
+    'converted': 'int8'
+}
+
+# Twin table storage: categoricals share one copy of each string, numbers use
+# the narrowest dtype that fits their range
+TWIN_DTYPES = {
+    'user_id': np.int64,
+    'age': np.int16,
+    'past_purchase_count': np.int16,
+    'historical_opens': np.int32,
+    'historical_clicks': np.int32,
+    'historical_conversions': np.int32,
+    'historical_sends': np.int32
+}
+
+# Category order for enum columns, matching models.py; unknown values are appended
+ENUM_CATEGORIES = {
+    'income_bracket': [level.value for level in IncomeLevel],
+    'interest_segment': [segment.value for segment in InterestSegment]
+}
+
+# Live engagement counters; int32 halves their size and fits any realistic history
+COUNTER_DTYPE = np.int32
+
+
+def build_twin_table(raw: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate raw campaign rows into one row per customer twin."""
+    agg = raw.groupby('user_id', sort=True).agg(
+        name=('name', 'first'),
+        age=('age', 'first'),
+        income_bracket=('income_bracket', 'first'),
+        interest_segment=('interest_segment', 'first'),
+        past_purchase_count=('past_purchase_count', 'first'),
+        historical_opens=('opened', 'sum'),
+        historical_clicks=('clicked', 'sum'),
+        historical_conversions=('converted', 'sum'),
+        historical_sends=('opened', 'size')
+    ).reset_index()
+
+    return compact_twin_table(agg[TWIN_COLUMNS])
+
+
+def compact_twin_table(table: pd.DataFrame) -> pd.DataFrame:
+    """Twin table with categorical strings and narrow integer columns."""
+    data = {}
+    for col in TWIN_COLUMNS:
+        values = table[col]
+        if col in TWIN_DTYPES:
+            data[col] = values.to_numpy().astype(TWIN_DTYPES[col], copy=False)
+        elif col in ENUM_CATEGORIES:
+            known = ENUM_CATEGORIES[col]
+            extra = sorted(set(values.dropna().astype(str).unique()) - set(known))
+            data[col] = pd.Categorical(values, categories=known + extra)
+        else:
+            # Names repeat heavily, so each distinct string is stored once
+            data[col] = values.astype('category').cat.remove_unused_categories()
+    return pd.DataFrame(data, columns=TWIN_COLUMNS)
+
+
+def read_raw_data(path: Path = DATA_PATH) -> pd.DataFrame:
+    """Campaign records with only the columns twins are built from, parsed into compact dtypes."""
+    return pd.read_csv(path, usecols=list(RAW_DTYPES), dtype=RAW_DTYPES)
+
+
+def _position_dtype(n: int) -> np.dtype:
+    """Narrowest dtype for row positions into a table of n rows."""
+    return np.dtype(np.int32 if n < np.iinfo(np.int32).max else np.int64)
+
+
+class TwinStore:
+    """
+    Materialized customer twin table, built once and indexed by user_id.
+
+    Rows are kept sorted by user_id, so positional selections come back in the
+    same order the old per-request groupby produced.
+    """
+
+    def __init__(self, raw: Optional[pd.DataFrame] = None):
+        self.table: pd.DataFrame = None
+        self.user_ids: np.ndarray = None
+        self.index: pd.Index = None
+        self.version = 0
+        self._codes: Dict[str, np.ndarray] = {}
+        self._category_ids: Dict[str, Dict[str, int]] = {}
+        self._postings: Dict[str, list] = {}
+        self._ages: np.ndarray = None
+        self._age_order: np.ndarray = None
+        self._ages_sorted: np.ndarray = None
+        self.profiles: pd.DataFrame = None
+        self.profile_ids: np.ndarray = None
+        self.counters: Dict[str, np.ndarray] = {}
+        self.counters_version = 0
+        self._counter_lock = threading.RLock()
+        self._results = LRUCache(RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_BYTES)
+        if raw is not None:
+            self.load(build_twin_table(raw))
+
+    @classmethod
+    def from_table(cls, table: pd.DataFrame) -> 'TwinStore':
+        """Store over an already aggregated twin table (e.g. from a snapshot)."""
+        store = cls()
+        store.load(table)
+        return store
+
+    def load(self, table: pd.DataFrame):
+        """Index an aggregated twin table sorted by user_id and make it current."""
+        self.user_ids = table['user_id'].to_numpy()
+        self.index = pd.Index(self.user_ids)
+        self.table = table
+        self._build_indexes()
+        self._build_profiles()
+        with self._counter_lock:
+            # Always a private copy: the table may be a read-only memory map
+            self.counters = {col: table[col].to_numpy().astype(COUNTER_DTYPE) for col in COUNTER_COLUMNS}
+            self.counters_version = 0
+        self.version = next(_versions)
+        self._results.clear()
+
+    def _build_indexes(self):
+        """Build categorical posting lists and the sorted age index."""
+        position_dtype = _position_dtype(len(self.table))
+        for col in INDEXED_CATEGORIES:
+            series = self.table[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Reuse the stored codes instead of re-encoding the column
+                codes, values = series.cat.codes.to_numpy(), series.cat.categories
+            else:
+                codes, values = pd.factorize(series, sort=True)
+            self._codes[col] = codes
+            self._category_ids[col] = {v: i for i, v in enumerate(values)}
+            # Stable argsort groups positions by code while keeping them ascending
+            order = np.argsort(codes, kind='stable').astype(position_dtype)
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            self._postings[col] = [order[bounds[i]:bounds[i + 1]] for i in range(len(values))]
+
+        self._ages = self.table['age'].to_numpy()
+        self._age_order = np.argsort(self._ages, kind='stable').astype(position_dtype)
+        self._ages_sorted = self._ages[self._age_order]
+
+    def _build_profiles(self):
+        """Deduplicate twins into unique model feature profiles."""
+        keys = self.table[PROFILE_COLUMNS]
+        self.profile_ids = keys.groupby(PROFILE_COLUMNS, sort=False, dropna=False,
+                                        observed=True).ngroup().to_numpy().astype(np.int32)
+        _, first = np.unique(self.profile_ids, return_index=True)
+        profiles = keys.take(first).reset_index(drop=True)
+        # The models were fitted on plain string columns
+        for col in PROFILE_COLUMNS:
+            if isinstance(profiles[col].dtype, pd.CategoricalDtype):
+                profiles[col] = profiles[col].astype(object)
+        self.profiles = profiles
+
+    @property
+    def filter_cache(self) -> LRUCache:
+        """Cached filter results, exposed for metrics."""
+        return self._results
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def memory_budget(self) -> dict:
+        """
+        Bytes held per component, in total and per twin.
+
+        Memory-mapped snapshot columns are counted too, though their pages
+        are shared between workers and only resident once touched.
+        """
+        table = {col: int(self.table[col].memory_usage(index=False, deep=True)) for col in TWIN_COLUMNS}
+        parts = {
+            'table': sum(table.values()),
+            'counters': sum(c.nbytes for c in self.counters.values()),
+            'index': int(self.index.memory_usage(deep=True)),
+            'category_index': sum(c.nbytes for c in self._codes.values())
+                + sum(p.nbytes for postings in self._postings.values() for p in postings),
+            'age_index': self._age_order.nbytes + self._ages_sorted.nbytes,
+            'profiles': int(self.profiles.memory_usage(index=False, deep=True).sum())
+                + self.profile_ids.nbytes
+        }
+        total = sum(parts.values())
+        n = max(len(self), 1)
+        return {
+            'twins': len(self),
+            'bytes': total,
+            'bytes_per_twin': round(total / n, 1),
+            'parts': parts,
+            'table_columns_per_twin': {col: round(b / n, 2) for col, b in table.items()}
+        }
+
+    def category_codes(self, column: str) -> np.ndarray:
+        """Integer code per twin for an indexed categorical column."""
+        return self._codes[column]
+
+    def category_values(self, column: str) -> List[str]:
+        """Values of an indexed categorical column, in code order."""
+        return list(self._category_ids[column])
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Row position of a single customer, or None if unknown."""
+        try:
+            return self.index.get_loc(user_id)
+        except KeyError:
+            return None
+
+    def positions(self, user_ids: Sequence[int]) -> np.ndarray:
+        """Sorted, de-duplicated row positions for the known IDs in user_ids."""
+        ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        found = self.index.get_indexer(ids)
+        return found[found >= 0]
+
+    def get(self, user_id: int) -> Optional[dict]:
+        """Get a single customer's twin row as a dict."""
+        pos = self.position(user_id)
+        if pos is None:
+            return None
+        return self.records(np.array([pos]))[0]
+
+    def take(self, user_ids: Sequence[int]) -> pd.DataFrame:
+        """Get twin rows for the given IDs, ignoring unknown and repeated IDs."""
+        positions = self.positions(user_ids)
+        rows = self.table.take(positions)
+        with self._counter_lock:
+            for col in COUNTER_COLUMNS:
+                rows[col] = self.counters[col][positions]
+        return rows
+
+    def current_table(self) -> pd.DataFrame:
+        """The whole twin table with the live counter values; other columns are shared, not copied."""
+        table = self.table.copy(deep=False)
+        with self._counter_lock:
+            for col in COUNTER_COLUMNS:
+                table[col] = self.counters[col].copy()
+        return table
+
+    def records(self, positions: np.ndarray, columns: Sequence[str] = TWIN_COLUMNS) -> List[dict]:
+        """Twin rows at the given positions as plain dicts, built column-wise."""
+        with self._counter_lock:
+            values = [self.column(col, positions) for col in columns]
+        values = [v.tolist() for v in values]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def columns(self, positions: np.ndarray, columns: Sequence[str] = TWIN_COLUMNS) -> Dict[str, np.ndarray]:
+        """Column arrays for the twins at the given positions."""
+        with self._counter_lock:
+            return {col: self.column(col, positions) for col in columns}
+
+    def column(self, column: str, positions: np.ndarray) -> np.ndarray:
+        """Values of one column at the given positions, decoding categoricals."""
+        if column in self.counters:
+            with self._counter_lock:
+                return self.counters[column][positions]
+        series = self.table[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()[positions]
+            return series.cat.categories.to_numpy()[codes]
+        return series.to_numpy()[positions]
+
+    def apply_counts(self, user_ids: np.ndarray, deltas: np.ndarray) -> int:
+        """
+        Add per-twin counter deltas, shaped (ids, COUNTER_COLUMNS), in place.
+
+        Updates happen under the counter lock, so readers see either all or
+        none of a batch. Returns the number of known IDs that were applied.
+        """
+        positions = self.index.get_indexer(user_ids)
+        known = positions >= 0
+        positions, deltas = positions[known], deltas[known]
+        with self._counter_lock:
+            for i, col in enumerate(COUNTER_COLUMNS):
+                np.add.at(self.counters[col], positions, deltas[:, i])
+            self.counters_version += 1
+        return int(known.sum())
+
+    def seek(self, positions: np.ndarray, after_user_id: int) -> int:
+        """Offset into sorted positions of the first twin with user_id > after_user_id."""
+        bound = np.searchsorted(self.user_ids, after_user_id, side='right')
+        return int(np.searchsorted(positions, bound, side='left'))
+
+    def filter(
+        self,
+        segment: Optional[str] = None,
+        income: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Sorted row positions matching all given filters.
+
+        Starts from the most selective index and checks the remaining filters
+        against that candidate set only, so cost follows the result size.
+        Result sets are cached so later pages of the same query are cheap;
+        an unfiltered query is just every position and is not cached.
+        """
+        if not (segment or income or min_age or max_age):
+            return np.arange(len(self.table), dtype=_position_dtype(len(self.table)))
+
+        key = (segment, income, min_age, max_age)
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        result = self._evaluate_filter(segment, income, min_age, max_age)
+        result.setflags(write=False)
+        self._results.put(key, result, size=result.nbytes)
+        return result
+
+    def _evaluate_filter(
+        self,
+        segment: Optional[str],
+        income: Optional[str],
+        min_age: Optional[int],
+        max_age: Optional[int]
+    ) -> np.ndarray:
+        # Candidate sets as (positions, is_sorted, source)
+        candidates = []
+        for col, value in (('interest_segment', segment), ('income_bracket', income)):
+            if value:
+                code = self._category_ids[col].get(value)
+                if code is None:
+                    return np.empty(0, dtype=_position_dtype(len(self.table)))
+                candidates.append((self._postings[col][code], True, col))
+        if min_age or max_age:
+            lo, hi = self._age_range(min_age, max_age)
+            candidates.append((self._age_order[lo:hi], False, 'age'))
+
+        positions, is_sorted, source = min(candidates, key=lambda c: len(c[0]))
+        for col, value in (('interest_segment', segment), ('income_bracket', income)):
+            if value and col != source:
+                code = self._category_ids[col][value]
+                positions = positions[self._codes[col][positions] == code]
+        if (min_age or max_age) and source != 'age':
+            ages = self._ages[positions]
+            if min_age:
+                positions = positions[ages >= min_age]
+                ages = self._ages[positions]
+            if max_age:
+                positions = positions[ages <= max_age]
+
+        if not is_sorted:
+            positions = np.sort(positions)
+        # Positions keep the index dtype (int32 below 2**31 twins), halving cached bytes
+        return positions
+
+    def _age_range(self, min_age: Optional[int], max_age: Optional[int]) -> Tuple[int, int]:
+        """Slice bounds into the sorted age index for an inclusive age range."""
+        lo = np.searchsorted(self._ages_sorted, min_age, side='left') if min_age else 0
+        hi = np.searchsorted(self._ages_sorted, max_age, side='right') if max_age else len(self._ages_sorted)
+        return int(lo), int(max(lo, hi))
+
+    def count(
+        self,
+        segment: Optional[str] = None,
+        income: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None
+    ) -> int:
+        """Number of twins matching the given filters."""
+        if not (segment or income or min_age or max_age):
+            return len(self.table)
+        return len(self.filter(segment, income, min_age, max_age))
@@ -1,43 +1,81 @@
+import argparse
 import pandas as pd
 import numpy as np
 import random
+from pathlib import Path
+
+# Name pools for realistic synthetic names
+FIRST_NAMES = [
+    "Emma", "Liam", "Olivia", "Noah", "Ava", "Ethan", "Sophia", "Mason",
+    "Isabella", "William", "Mia", "James", "Charlotte", "Benjamin", "Amelia",
+    "Lucas", "Harper", "Henry", "Evelyn", "Alexander", "Abigail", "Michael",
+    "Emily", "Daniel", "Elizabeth", "Jacob", "Sofia", "Logan", "Avery", "Jackson",
+    "Ella", "Sebastian", "Scarlett", "Aiden", "Grace", "Matthew", "Chloe", "Samuel",
+    "Victoria", "David", "Riley", "Joseph", "Aria", "Carter", "Lily", "Owen",
+    "Aubrey", "Wyatt", "Zoey", "John", "Penelope", "Jack", "Layla", "Luke",
+    "Camila", "Jayden", "Nora", "Dylan", "Hannah", "Grayson", "Sarah", "Levi",
+    "Addison", "Isaac", "Eleanor", "Gabriel", "Natalie", "Julian", "Luna", "Mateo",
+    "Savannah", "Anthony", "Brooklyn", "Jaxon", "Leah", "Lincoln", "Zoe", "Joshua"
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
+    "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker",
+    "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores",
+    "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell",
+    "Carter", "Roberts", "Chen", "Kim", "Patel", "Shah", "Singh", "Kumar", "Ali",
+    "Murphy", "Cook", "Rogers", "Morgan", "Peterson", "Cooper", "Reed", "Bailey"
+]
+
+SUBJECT_LINES = {
+    'Promo': [
+        "Flash Sale: 50% Off Everything!", "Your Exclusive Discount Inside", 
+        "Last Chance for Black Friday Deals", "Save Big on Your Favorites"
+    ],
+    'Newsletter': [
+        "This Week's Top Trends", "5 Tips for Better Living", 
+        "What's New at Our Store", "Curated Picks Just for You"
+    ],
+    'Welcome': [
+        "Welcome to the Family!", "Thanks for Signing Up - Here's 10% Off", 
+        "Getting Started with Your Account"
+    ],
+    'Cart Abandonment': [
+        "You Left Something Behind", "Complete Your Purchase Now", 
+        "Still Thinking About It?"
+    ]
+}
+
+CAMPAIGN_TYPES = ['Promo', 'Newsletter', 'Welcome', 'Cart Abandonment']
+CAMPAIGN_TYPE_P = [0.4, 0.3, 0.1, 0.2]
+SEGMENTS = ['Tech Enthusiast', 'Fashionista', 'Home Decor', 'Bargain Hunter']
+INCOME_BRACKETS = ['Low', 'Medium', 'High']
+INCOME_P = [0.3, 0.5, 0.2]
+
+# Age bands (low, high exclusive) and their shares of users
+AGE_BANDS = np.array([[18, 25], [25, 45], [45, 70]])
+AGE_BAND_P = [0.15, 0.50, 0.35]
+
+OUTPUT_COLS = [
+    'user_id', 'name', 'age', 'income_bracket', 'interest_segment', 'past_purchase_count',
+    'campaign_id', 'campaign_type', 'subject_line', 'subject_length', 'send_hour',
+    'opened', 'clicked', 'unsubscribed', 'converted'
+]
+
 
 def generate_balanced_ecommerce_data(n_samples=10000):
     print(f"Generating {n_samples} balanced e-commerce records...")
     np.random.seed(42)
     random.seed(42)
 
-    # Name pools for realistic synthetic names
-    first_names = [
-        "Emma", "Liam", "Olivia", "Noah", "Ava", "Ethan", "Sophia", "Mason",
-        "Isabella", "William", "Mia", "James", "Charlotte", "Benjamin", "Amelia",
-        "Lucas", "Harper", "Henry", "Evelyn", "Alexander", "Abigail", "Michael",
-        "Emily", "Daniel", "Elizabeth", "Jacob", "Sofia", "Logan", "Avery", "Jackson",
-        "Ella", "Sebastian", "Scarlett", "Aiden", "Grace", "Matthew", "Chloe", "Samuel",
-        "Victoria", "David", "Riley", "Joseph", "Aria", "Carter", "Lily", "Owen",
-        "Aubrey", "Wyatt", "Zoey", "John", "Penelope", "Jack", "Layla", "Luke",
-        "Camila", "Jayden", "Nora", "Dylan", "Hannah", "Grayson", "Sarah", "Levi",
-        "Addison", "Isaac", "Eleanor", "Gabriel", "Natalie", "Julian", "Luna", "Mateo",
-        "Savannah", "Anthony", "Brooklyn", "Jaxon", "Leah", "Lincoln", "Zoe", "Joshua"
-    ]
-    
-    last_names = [
-        "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
-        "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
-        "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
-        "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker",
-        "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores",
-        "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell",
-        "Carter", "Roberts", "Chen", "Kim", "Patel", "Shah", "Singh", "Kumar", "Ali",
-        "Murphy", "Cook", "Rogers", "Morgan", "Peterson", "Cooper", "Reed", "Bailey"
-    ]
-
     # 1. Base User Data
     # ---------------------------------------------------------
     user_ids = range(1001, 1001 + n_samples)
     
     # Generate unique names for each user
-    names = [f"{random.choice(first_names)} {random.choice(last_names)}" for _ in range(n_samples)]
+    names = [f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}" for _ in range(n_samples)]
     
     # Age: Mixed distribution
     ages = np.concatenate([
@@ -57,29 +95,10 @@ def generate_balanced_ecommerce_data(n_samples=10000):
     # We create a pool of campaigns to assign randomly
     campaign_pool = []
     
-    subject_lines_map = {
-        'Promo': [
-            "Flash Sale: 50% Off Everything!", "Your Exclusive Discount Inside", 
-            "Last Chance for Black Friday Deals", "Save Big on Your Favorites"
-        ],
-        'Newsletter': [
-            "This Week's Top Trends", "5 Tips for Better Living", 
-            "What's New at Our Store", "Curated Picks Just for You"
-        ],
-        'Welcome': [
-            "Welcome to the Family!", "Thanks for Signing Up - Here's 10% Off", 
-            "Getting Started with Your Account"
-        ],
-        'Cart Abandonment': [
-            "You Left Something Behind", "Complete Your Purchase Now", 
-            "Still Thinking About It?"
-        ]
-    }
-
     # Generate 50 unique campaigns
     for i in range(50):
         c_type = np.random.choice(['Promo', 'Newsletter', 'Welcome', 'Cart Abandonment'], p=[0.4, 0.3, 0.1, 0.2])
-        subj = random.choice(subject_lines_map[c_type])
+        subj = random.choice(SUBJECT_LINES[c_type])
         c_id = f"CMP-{1000+i}"
         
         campaign_pool.append({
@@ -156,13 +175,7 @@ def generate_balanced_ecommerce_data(n_samples=10000):
 
     # 4. Save
     # ---------------------------------------------------------
-    output_cols = [
-        'user_id', 'name', 'age', 'income_bracket', 'interest_segment', 'past_purchase_count',
-        'campaign_id', 'campaign_type', 'subject_line', 'subject_length', 'send_hour',
-        'opened', 'clicked', 'unsubscribed', 'converted'
-    ]
-    
-    final_df = df[output_cols]
+    final_df = df[OUTPUT_COLS]
     final_df.to_csv('ecommerce_marketing_data.csv', index=False)
     
     # Print Stats for Verification
@@ -173,5 +186,145 @@ def generate_balanced_ecommerce_data(n_samples=10000):
     print(f"Conversion Rate: {final_df['converted'].mean():.2%}")
     print("File saved: ecommerce_marketing_data.csv")
 
+
+def make_campaign_pool(rng, n_campaigns=50):
+    """Random campaigns as arrays: ids, types, subject lines, subject lengths, send hours."""
+    type_codes = rng.choice(len(CAMPAIGN_TYPES), n_campaigns, p=CAMPAIGN_TYPE_P)
+    subjects = np.array([s for t in CAMPAIGN_TYPES for s in SUBJECT_LINES[t]])
+    sizes = np.array([len(SUBJECT_LINES[t]) for t in CAMPAIGN_TYPES])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    picks = offsets[type_codes] + (rng.random(n_campaigns) * sizes[type_codes]).astype(int)
+    subject_lines = subjects[picks]
+    return {
+        'campaign_id': np.char.add('CMP-', (1000 + np.arange(n_campaigns)).astype(str)),
+        'campaign_type': np.array(CAMPAIGN_TYPES)[type_codes],
+        'subject_line': subject_lines,
+        'subject_length': np.char.str_len(subject_lines),
+        'send_hour': rng.integers(8, 22, n_campaigns)
+    }
+
+
+def simulate_chunk(rng, first_user_id, n_users, campaigns_per_user, pool):
+    """One chunk of rows: n_users users, each sent campaigns_per_user random campaigns."""
+    # Users
+    full_names = np.char.add(np.char.add(np.repeat(FIRST_NAMES, len(LAST_NAMES)), ' '),
+                             np.tile(LAST_NAMES, len(FIRST_NAMES)))
+    names = full_names[rng.integers(0, len(full_names), n_users)]
+    bands = AGE_BANDS[rng.choice(len(AGE_BANDS), n_users, p=AGE_BAND_P)]
+    ages = bands[:, 0] + (rng.random(n_users) * (bands[:, 1] - bands[:, 0])).astype(int)
+    segments = rng.choice(SEGMENTS, n_users)
+    incomes = rng.choice(INCOME_BRACKETS, n_users, p=INCOME_P)
+    past_purchases = rng.poisson(lam=3, size=n_users)
+
+    # One row per (user, campaign) send
+    n_rows = n_users * campaigns_per_user
+    user = np.repeat(np.arange(n_users), campaigns_per_user)
+    campaign = rng.integers(0, len(pool['campaign_id']), n_rows)
+    c_type = pool['campaign_type'][campaign]
+    subject_length = pool['subject_length'][campaign]
+    segment = segments[user]
+    age = ages[user]
+    purchases = past_purchases[user]
+
+    # Same outcome logic as generate_balanced_ecommerce_data
+    prob_open = (0.30
+                 + 0.30 * (c_type == 'Welcome')
+                 + 0.20 * (c_type == 'Cart Abandonment')
+                 + 0.15 * ((segment == 'Bargain Hunter') & (c_type == 'Promo'))
+                 + 0.05 * (subject_length < 35)
+                 + rng.normal(0, 0.05, n_rows))
+    opened = rng.random(n_rows) < np.clip(prob_open, 0, 1)
+
+    prob_click = np.clip(0.10 + 0.15 * (c_type == 'Promo') + 0.10 * (purchases > 4), 0, 1)
+    clicked = opened & (rng.random(n_rows) < prob_click)
+
+    prob_unsub = np.clip(0.01 + 0.04 * (c_type == 'Newsletter') + 0.03 * (age > 60)
+                         + 0.02 * (purchases == 0), 0, 1)
+    unsubscribed = rng.random(n_rows) < prob_unsub
+
+    converted = clicked & (rng.random(n_rows) < 0.25)
+
+    return pd.DataFrame({
+        'user_id': first_user_id + user,
+        'name': names[user],
+        'age': age,
+        'income_bracket': incomes[user],
+        'interest_segment': segment,
+        'past_purchase_count': purchases,
+        'campaign_id': pool['campaign_id'][campaign],
+        'campaign_type': c_type,
+        'subject_line': pool['subject_line'][campaign],
+        'subject_length': subject_length,
+        'send_hour': pool['send_hour'][campaign],
+        'opened': opened.astype(int),
+        'clicked': clicked.astype(int),
+        'unsubscribed': unsubscribed.astype(int),
+        'converted': converted.astype(int)
+    }, columns=OUTPUT_COLS)
+
+
+def generate_ecommerce_data_chunked(n_users=10000, campaigns_per_user=1, seed=42,
+                                    out_path='ecommerce_marketing_data.csv',
+                                    chunk_users=100000, n_campaigns=50):
+    """
+    Vectorized generator for large datasets, streamed to CSV or Parquet.
+    
+    Users are generated chunk_users at a time, each with campaigns_per_user
+    rows, so memory stays bounded by the chunk size. Output is determined by
+    seed and chunk_users. Parquet output (by file extension) needs pyarrow.
+    """
+    out_path = Path(out_path)
+    parquet = out_path.suffix == '.parquet'
+    print(f"Generating {n_users} users x {campaigns_per_user} campaigns into {out_path}...")
+    pool = make_campaign_pool(np.random.default_rng([seed, 0]), n_campaigns)
+
+    writer = None
+    rows = 0
+    totals = np.zeros(4, dtype=np.int64)
+    try:
+        for chunk, start in enumerate(range(0, n_users, chunk_users)):
+            rng = np.random.default_rng([seed, chunk + 1])
+            df = simulate_chunk(rng, 1001 + start, min(chunk_users, n_users - start),
+                                campaigns_per_user, pool)
+            if parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+            else:
+                df.to_csv(out_path, mode='w' if chunk == 0 else 'a', header=chunk == 0, index=False)
+            rows += len(df)
+            totals += df[['opened', 'clicked', 'unsubscribed', 'converted']].to_numpy().sum(axis=0)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    rates = totals / max(rows, 1)
+    print("\n--- Data Generation Stats ---")
+    print(f"Rows: {rows}")
+    print(f"Open Rate: {rates[0]:.2%}")
+    print(f"Click Rate (Total): {rates[1]:.2%}")
+    print(f"Unsubscribe Rate: {rates[2]:.2%}")
+    print(f"Conversion Rate: {rates[3]:.2%}")
+    print(f"File saved: {out_path}")
+
+
 if __name__ == "__main__":
-    generate_balanced_ecommerce_data()
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic campaign data. Without --users, writes the "
+                    "original 10000-row ecommerce_marketing_data.csv."
+    )
+    parser.add_argument("--users", type=int, help="users to generate with the chunked generator")
+    parser.add_argument("--campaigns-per-user", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-users", type=int, default=100000, help="users per written chunk")
+    parser.add_argument("--out", default="ecommerce_marketing_data.csv", help=".csv or .parquet")
+    args = parser.parse_args()
+
+    if args.users is None:
+        generate_balanced_ecommerce_data()
+    else:
+        generate_ecommerce_data_chunked(args.users, args.campaigns_per_user, args.seed,
+                                        args.out, args.chunk_users)
@@ -55,21 +55,21 @@ export const ABCompareView: React.FC<ABCompareViewProps> = ({
     try {
       const customerIds = Array.from(selectedIds);
       
-      // Run both simulations in parallel
-      const [resA, resB] = await Promise.all([
-        api.simulate(customerIds, {
+      // Score both variants in one batch against the shared audience
+      const { summaries } = await api.simulateBatch(customerIds, [
+        {
           type: campaignA.type as Campaign['type'],
           subject_line: campaignA.subject_line,
           send_hour: campaignA.send_hour
-        }),
-        api.simulate(customerIds, {
+        },
+        {
           type: campaignB.type as Campaign['type'],
           subject_line: campaignB.subject_line,
           send_hour: campaignB.send_hour
-        })
+        }
       ]);
       
-      setResults({ a: resA.summary, b: resB.summary });
+      setResults({ a: summaries[0], b: summaries[1] });
     } catch (err) {
       console.error('Comparison failed:', err);
     } finally {
@@ -1,4 +1,4 @@
-import type { Campaign, CustomerListResponse, SimulationResponse, CampaignTypeInfo } from '../types';
+import type { Campaign, CustomerListResponse, SimulationResponse, BatchSimulationResponse, CampaignTypeInfo } from '../types';
 
 const API_BASE = 'http://localhost:8000';
 
@@ -47,4 +47,17 @@ export const api = {
         if (!res.ok) throw new Error('Simulation failed');
         return res.json();
     },
+
+    async simulateBatch(customerIds: number[], variants: Campaign[]): Promise<BatchSimulationResponse> {
+        const res = await fetch(`${API_BASE}/simulate/batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                customer_ids: customerIds,
+                variants,
+            }),
+        });
+        if (!res.ok) throw new Error('Batch simulation failed');
+        return res.json();
+    },
 };
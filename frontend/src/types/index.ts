@@ -9,6 +9,7 @@ export interface Customer {
     historical_opens?: number;
     historical_clicks?: number;
     historical_conversions?: number;
+    historical_sends?: number;
 }
 
 export interface Campaign {
@@ -53,9 +54,56 @@ export interface SimulationSummary {
     conversion_rate: number;
 }
 
+export interface GroupSummary extends SimulationSummary {
+    value: string;
+}
+
+export type DetailLevel = 'full' | 'summary' | 'breakdown' | 'sample' | 'top' | 'rollup';
+
+export interface GroupRollup {
+    value: string;
+    total_customers: number;
+    expected_opens: number;
+    expected_clicks: number;
+    expected_unsubscribes: number;
+    expected_conversions: number;
+    open_rate: number;
+    click_rate: number;
+    unsubscribe_rate: number;
+    conversion_rate: number;
+    historical_sends: number;
+    baseline_open_rate?: number | null;
+    baseline_click_rate?: number | null;
+    baseline_conversion_rate?: number | null;
+    open_uplift?: number | null;
+    click_uplift?: number | null;
+    conversion_uplift?: number | null;
+    open_lift?: number | null;
+    click_lift?: number | null;
+    conversion_lift?: number | null;
+}
+
 export interface SimulationResponse {
     summary: SimulationSummary;
     predictions: CustomerPrediction[];
+    breakdowns?: Record<string, GroupSummary[]> | null;
+    rollup?: GroupRollup | null;
+    rollups?: Record<string, GroupRollup[]> | null;
+}
+
+export interface VariantComparison {
+    variant_a: number;
+    variant_b: number;
+    metric: string;
+    lift: number | null;
+    z_score: number;
+    p_value: number;
+    significant: boolean;
+}
+
+export interface BatchSimulationResponse {
+    summaries: SimulationSummary[];
+    comparisons: VariantComparison[];
 }
 
 export interface CustomerListResponse {
@@ -63,4 +111,5 @@ export interface CustomerListResponse {
     total: number;
     page: number;
     page_size: number;
+    next_cursor?: number | null;
 }